@@ -6,486 +6,182 @@ By Eric Espinosa
 
 Merged Application for Lakes HOA (Painting, Remodel, Roofing, Solar)
 """
+import os
+import shutil
+import tempfile
+import threading
 import streamlit as st
-import io
 from datetime import date
-from pypdf import PdfWriter, PdfReader
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+from metrics import METRICS
+from forms import FORMS
+from jobs import DONE, FAILED, RUNNING, QueueFull
+
+# pdf_engine (pypdf and the templates) is imported on first use, not here, so
+# the first page can render while it loads in the background
 
 # --- 1. CONFIGURATION (MUST BE FIRST) ---
 st.set_page_config(page_title="Lakes HOA Portal", page_icon="🏡")
 
-# FILENAMES
-PAINT_PDF = "ACC-Application-Painting-November-2023.pdf"
-REMODEL_PDF = "ACC-Application-Remodels-Strucures-Landscape-June-2024.pdf"
-ROOFING_PDF = "ACC-Application-Roofing-November-2023.pdf"
-SOLAR_PDF = "ACC-Application-Solar-Energy-Panel-November-2023.pdf"
-
-# ==========================================
-# 2. HELPER FUNCTIONS
-# ==========================================
-def draw_helper(can, data, x, y, key):
-    """Simple helper to check if key exists before drawing"""
-    if data.get(key): 
-        can.drawString(x, y, str(data.get(key)))
-
-def check_helper(can, data, x, y, key):
-    """Draws an X if the boolean key is True"""
-    if data.get(key): 
-        can.drawString(x, y, "X")
-
-# ==========================================
-# 3. OVERLAY ENGINES
-# ==========================================
-
-def create_painting_overlay(data):
-    packet = io.BytesIO()
-    can = canvas.Canvas(packet, pagesize=letter)
-    can.setFont("Helvetica", 10)
-    
-    # --- PAGE 1 (Matches PDF Page 2) ---
-    draw_helper(can, data, 170, 670, "date_prepared") 
-    draw_helper(can, data, 170, 653, "owner_name")   
-    draw_helper(can, data, 425, 653, "lot_number")   
-    draw_helper(can, data, 170, 635, "address")      
-    draw_helper(can, data, 170, 607, "designated_contact")
-    
-    draw_helper(can, data, 170, 578, "home_phone")   
-    draw_helper(can, data, 425, 578, "work_phone")   
-    draw_helper(can, data, 170, 565, "mobile_phone") 
-    draw_helper(can, data, 425, 565, "email")        
-    
-    draw_helper(can, data, 170, 550, "start_date")   
-    draw_helper(can, data, 425, 550, "end_date")     
-
-    draw_helper(can, data, 150, 295, "contractor_name")
-    draw_helper(can, data, 150, 280, "contractor_address")
-    draw_helper(can, data, 150, 268, "contractor_phone")
-
-    # Paint Table
-    draw_helper(can, data, 160, 178, "siding_mfg"); draw_helper(can, data, 250, 178, "siding_id"); draw_helper(can, data, 400, 178, "siding_name")
-    draw_helper(can, data, 160, 164, "brickwork_mfg"); draw_helper(can, data, 250, 164, "brickwork_id"); draw_helper(can, data, 400, 164, "brickwork_name")
-    draw_helper(can, data, 160, 152, "trim_mfg"); draw_helper(can, data, 250, 152, "trim_id"); draw_helper(can, data, 400, 152, "trim_name")
-    draw_helper(can, data, 160, 137, "shutter_mfg"); draw_helper(can, data, 250, 137, "shutter_id"); draw_helper(can, data, 400, 137, "shutter_name")
-    draw_helper(can, data, 160, 125, "door_mfg"); draw_helper(can, data, 250, 125, "door_id"); draw_helper(can, data, 400, 125, "door_name")
-    draw_helper(can, data, 160, 110, "fence_mfg"); draw_helper(can, data, 250, 110, "fence_id"); draw_helper(can, data, 400, 110, "fence_name")
-    draw_helper(can, data, 160, 98, "other_mfg"); draw_helper(can, data, 400, 98, "other_color_name") 
-
-    can.showPage() 
-
-    # --- PAGE 2 (Samples) ---
-    if data.get("samples_status") == "Samples Placed":
-        can.drawString(45, 645, "X") 
-        draw_helper(can, data, 60, 630, "samples_location") 
-    elif data.get("samples_status") == "Email ACC":
-        can.drawString(45, 612, "X")
-
-    can.save()
-    packet.seek(0)
-    return packet
-
-def create_remodel_overlay(data):
-    packet = io.BytesIO()
-    can = canvas.Canvas(packet, pagesize=letter)
-    can.setFont("Helvetica", 10)
-    
-    # --- PAGE 1 OF OVERLAY ---
-    draw_helper(can, data, 170, 625, "date_prepared")
-    draw_helper(can, data, 170, 610, "owner_name")
-    draw_helper(can, data, 425, 610, "lot_number")
-    draw_helper(can, data, 170, 587, "address")
-    draw_helper(can, data, 170, 555, "designated_contact")
-    
-    draw_helper(can, data, 170, 534, "home_phone")
-    draw_helper(can, data, 425, 534, "work_phone")
-    draw_helper(can, data, 170, 520, "mobile_phone")
-    draw_helper(can, data, 425, 520, "email")
-    
-    draw_helper(can, data, 170, 505, "start_date")
-    draw_helper(can, data, 425, 505, "end_date")
-    
-    draw_helper(can, data, 150, 330, "contractor_name")
-    draw_helper(can, data, 150, 317, "contractor_address")
-    draw_helper(can, data, 150, 304, "contractor_phone")
-
-    # Remodel Checkboxes
-    check_helper(can, data, 170, 225, "rem_room"); check_helper(can, data, 170, 215, "rem_win"); check_helper(can, data, 170, 202, "rem_mason")
-    check_helper(can, data, 290, 225, "rem_deck"); check_helper(can, data, 290, 215, "rem_cover"); check_helper(can, data, 290, 202, "rem_planter")
-    check_helper(can, data, 445, 225, "rem_drive"); check_helper(can, data, 445, 215, "rem_retain")
-    
-    can.showPage() 
-
-    # --- PAGE 2 OF OVERLAY ---
-    # Structures
-    check_helper(can, data, 185, 695, "str_fence"); check_helper(can, data, 185, 675, "str_bbq"); check_helper(can, data, 185, 660, "str_ac")
-    check_helper(can, data, 185, 645, "str_gen"); check_helper(can, data, 185, 630, "str_swing")
-    check_helper(can, data, 300, 695, "str_pool"); check_helper(can, data, 300, 675, "str_gazebo"); check_helper(can, data, 300, 660, "str_trellis")
-    check_helper(can, data, 300, 645, "str_hoop"); check_helper(can, data, 300, 630, "str_gym")
-    check_helper(can, data, 425, 695, "str_wall"); check_helper(can, data, 425, 675, "str_green"); check_helper(can, data, 425, 660, "str_shed")
-    check_helper(can, data, 425, 645, "str_play"); check_helper(can, data, 425, 630, "str_tramp")
-
-    # Landscape
-    check_helper(can, data, 180, 505, "lnd_grade"); check_helper(can, data, 180, 485, "lnd_art")
-    check_helper(can, data, 330, 505, "lnd_retain"); check_helper(can, data, 330, 485, "lnd_tree_rem")
-    check_helper(can, data, 495, 505, "lnd_shrub"); check_helper(can, data, 495, 485, "lnd_conserv")
-
-    can.save()
-    packet.seek(0)
-    return packet
-
-def create_roofing_overlay(data):
-    packet = io.BytesIO()
-    can = canvas.Canvas(packet, pagesize=letter)
-    can.setFont("Helvetica", 10)
-    
-    # --- PAGE 1 OF OVERLAY (Matches PDF Page 2) ---
-    draw_helper(can, data, 190, 678, "owner_name")
-    draw_helper(can, data, 440, 650, "lot_number")
-    draw_helper(can, data, 190, 662, "address")
-    draw_helper(can, data, 190, 650, "date_prepared") 
-
-    draw_helper(can, data, 190, 635, "home_phone")
-    draw_helper(can, data, 440, 635, "work_phone")
-    draw_helper(can, data, 190, 620, "mobile_phone")
-    draw_helper(can, data, 440, 620, "email")
-    
-    draw_helper(can, data, 190, 605, "start_date")
-    draw_helper(can, data, 440, 605, "end_date")
-    
-    # Logic for Contractor Sections
-    roof_action = data.get("roof_action")
-    
-    if roof_action == "Replacement":
-        # General/Replacement Contractor (Top Box)
-        draw_helper(can, data, 200, 540, "contractor_name")
-        draw_helper(can, data, 200, 525, "contractor_address")
-        draw_helper(can, data, 200, 515, "contractor_phone")
-        
-    elif roof_action == "Cleaning":
-        # Cleaning Contractor (Middle Box)
-        draw_helper(can, data, 200, 465, "contractor_name")
-        draw_helper(can, data, 200, 450, "contractor_address")
-        draw_helper(can, data, 200, 438, "contractor_phone")
-        draw_helper(can, data, 200, 425, "roof_clean_product") 
-        
-    elif roof_action == "Tinting":
-        # Tinting (Bottom Box)
-        draw_helper(can, data, 60, 360, "roof_tint_mfg")
-        draw_helper(can, data, 150, 360, "roof_tint_id")
-        draw_helper(can, data, 290, 360, "roof_tint_name")
-
-    can.save()
-    packet.seek(0)
-    return packet
-
-def create_solar_overlay(data):
-    packet = io.BytesIO()
-    can = canvas.Canvas(packet, pagesize=letter)
-    can.setFont("Helvetica", 10)
-    
-    # --- PAGE 1 OF OVERLAY (Matches Solar PDF Page 2) ---
-    # VERIFIED USER COORDINATES
-    draw_helper(can, data, 190, 620, "owner_name")
-    draw_helper(can, data, 420, 588, "lot_number")
-    draw_helper(can, data, 190, 604, "address")
-    draw_helper(can, data, 190, 588, "date_prepared") 
-
-    draw_helper(can, data, 190, 575, "home_phone")
-    draw_helper(can, data, 420, 575, "work_phone")
-    draw_helper(can, data, 190, 560, "mobile_phone")
-    draw_helper(can, data, 420, 560, "email")
-    
-    draw_helper(can, data, 190, 540, "start_date")
-    draw_helper(can, data, 420, 540, "end_date")
-    
-    # Contractor Section (Solar)
-    draw_helper(can, data, 190, 490, "contractor_name")
-    draw_helper(can, data, 190, 477, "contractor_address")
-    draw_helper(can, data, 190, 460, "contractor_phone")
-
-    can.save()
-    packet.seek(0)
-    return packet
-
-# ==========================================
-# 4. PDF GENERATION LOGIC
-# ==========================================
-def generate_final_pdf(data, form_type):
-    start_page_idx = 1 # All forms currently start on Page 2 (Index 1)
-    
-    if form_type == "Painting":
-        overlay = create_painting_overlay(data)
-        src = PAINT_PDF
-    elif form_type == "Remodel":
-        overlay = create_remodel_overlay(data)
-        src = REMODEL_PDF
-    elif form_type == "Roofing":
-        overlay = create_roofing_overlay(data)
-        src = ROOFING_PDF
-    elif form_type == "Solar":
-        overlay = create_solar_overlay(data)
-        src = SOLAR_PDF
-
-    new_pdf = PdfReader(overlay)
-    existing_pdf = PdfReader(open(src, "rb"))
-    output = PdfWriter()
-
-    # Add Instructions (Page 1)
-    output.add_page(existing_pdf.pages[0])
-    
-    # Merge Page 1 of Overlay -> Form Page (Page 2)
-    page_form = existing_pdf.pages[start_page_idx]
-    if len(new_pdf.pages) > 0:
-        page_form.merge_page(new_pdf.pages[0])
-    output.add_page(page_form)
-
-    # Merge Page 2 of Overlay -> Next Page (If needed for Remodel/Paint)
-    if form_type in ["Remodel", "Painting"]:
-        page_next = existing_pdf.pages[start_page_idx + 1]
-        if len(new_pdf.pages) > 1:
-            page_next.merge_page(new_pdf.pages[1])
-        output.add_page(page_next)
-    else:
-        # Roofing/Solar don't have a second overlay page usually
-        # But we need to add the actual PDF page if it exists
-        if start_page_idx + 1 < len(existing_pdf.pages):
-             output.add_page(existing_pdf.pages[start_page_idx + 1])
-
-    # Add remaining pages
-    start_rest = start_page_idx + 2 if form_type in ["Remodel", "Painting"] else start_page_idx + 2
-    for i in range(start_rest, len(existing_pdf.pages)):
-        output.add_page(existing_pdf.pages[i])
-
-    return output
+def _prewarm():
+    import pdf_engine
+    pdf_engine.prewarm(optimize=True)
+
+@st.cache_resource(show_spinner=False)
+def start_prewarm():
+    """Loads the engine, templates and skeletons on a background thread, once per process"""
+    thread = threading.Thread(target=_prewarm, name="pdf-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource(show_spinner=False)
+def get_template_cache():
+    """Parsed templates shared by every session; the cache start_prewarm fills"""
+    import pdf_engine
+    return pdf_engine.TEMPLATES
+
+@st.cache_resource(show_spinner=False)
+def get_result_cache():
+    """Recently generated PDFs, keyed by form inputs and template hash"""
+    from pdf_engine import ResultCache
+    return ResultCache()
+
+@st.cache_resource(show_spinner=False)
+def get_archive(path):
+    """Every generated application, kept for later lookup (see archive.py)"""
+    from archive import Archive
+    return Archive(path)
+
+@st.cache_resource(show_spinner=False)
+def enable_metrics(log_path):
+    """Per-request stage timings, appended as JSON lines to log_path"""
+    METRICS.enable(log_path=log_path)
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue(jobs_path, workers):
+    """Background PDF generation shared by every session (see jobs.py)"""
+    from jobs import JobQueue, SqliteStore, application_handler, bundle_handler
+    archive = get_archive(ARCHIVE_PATH) if ARCHIVE_PATH else None
+    handlers = {
+        "application": application_handler(get_template_cache(), get_result_cache(), archive,
+                                            max_attachment_bytes=ATTACHMENT_MB * 1024 * 1024),
+        "bundle": bundle_handler(get_template_cache(), archive),
+    }
+    return JobQueue(handlers, workers=workers, store=SqliteStore(jobs_path) if jobs_path else None)
+
+if os.environ.get("ACC_METRICS_LOG"):
+    enable_metrics(os.environ["ACC_METRICS_LOG"])
+
+# Set ACC_ARCHIVE to an empty string to stop archiving
+ARCHIVE_PATH = os.environ.get("ACC_ARCHIVE", "acc_archive.db")
+# Cap on what uploaded supporting documents may add to the PDF
+ATTACHMENT_MB = int(os.environ.get("ACC_ATTACHMENT_MB", "20"))
+# PDFs generated at once; further submissions wait their turn in the queue
+JOB_WORKERS = int(os.environ.get("ACC_JOB_WORKERS", "2"))
+# Set ACC_JOBS to a file to keep queued jobs across restarts
+JOBS_PATH = os.environ.get("ACC_JOBS", "")
+# A submit waits this long for its PDF before showing progress instead
+SUBMIT_WAIT_SECONDS = 0.5
+POLL_SECONDS = 1.0
+
+start_prewarm()
 
 # ==========================================
-# 5. STREAMLIT UI
+# 2. STREAMLIT UI
 # ==========================================
 st.title("🏡 The Lakes HOA Application Portal")
 
-# Sidebar for Navigation
-app_mode = st.sidebar.selectbox("Select Application Type", 
-    ["Exterior Painting", "Remodel / Structure / Landscape", "Roofing", "Solar Energy Panel"])
+def render_items(items, container, form_data, uploads):
+    """Draws a form's UI items (forms.py, section 4) into container, storing
+    each input's value in form_data under its key and uploads in uploads"""
+    for item in items:
+        when = item.get("when")
+        if when and form_data.get(when[0]) != when[1]:
+            continue
+        kind = item["type"]
+        if kind in ("header", "subheader", "markdown", "info"):
+            getattr(container, kind)(item["text"])
+        elif kind == "text":
+            form_data[item["key"]] = container.text_input(item["label"], key=item.get("widget_key"))
+        elif kind == "select":
+            form_data[item["key"]] = container.selectbox(item["label"], item["options"], index=None,
+                                                         placeholder="Select...")
+        elif kind == "radio":
+            form_data[item["key"]] = container.radio(item["label"], item["options"], index=item.get("index"))
+        elif kind == "check":
+            form_data[item["key"]] = container.checkbox(item["label"])
+        elif kind == "columns":
+            for column, column_items in zip(container.columns(len(item["columns"])), item["columns"]):
+                render_items(column_items, column, form_data, uploads)
+        elif kind == "expander":
+            render_items(item["items"], container.expander(item["label"], expanded=item.get("expanded", False)),
+                         form_data, uploads)
+        elif kind == "uploads":
+            uploads.extend(container.file_uploader(
+                item["label"], type=["pdf", "jpg", "jpeg", "png"], accept_multiple_files=True,
+                help=item.get("help", "").format(mb=ATTACHMENT_MB)) or [])
+
+# Sidebar for Navigation; the list follows the form registry, so forms added
+# to the forms directory show up on the next rerun
+app_mode = st.sidebar.selectbox("Select Application Type", [spec.label for spec in FORMS.values()])
+spec = FORMS.by_label(app_mode)
 
-# --- COMMON FIELDS ---
-st.subheader("1. Homeowner Information")
-c1, c2 = st.columns(2)
-owner_name = c1.text_input("Name")
-lot_number = c2.text_input("Lot Number")
-address = st.text_input("Address")
-designated_contact = st.text_input("Designated Contact (if different)")
-
-c3, c4 = st.columns(2)
-home_phone = c3.text_input("Home Phone")
-email = c4.text_input("Email")
-
-st.subheader("2. Project Timeline")
-c5, c6 = st.columns(2)
-start_date = c5.date_input("Proposed Start Date")
-end_date = c6.date_input("Est. Completion Date")
-
-# --- APP SPECIFIC UI ---
 form_data = {}
-
-# === EXTERIOR PAINTING UI ===
-if app_mode == "Exterior Painting":
-    st.subheader("3. Contractor Information")
-    c7, c8 = st.columns(2)
-    contractor_name = c7.text_input("Contractor Name")
-    contractor_phone = c8.text_input("Contractor Phone")
-    contractor_address = st.text_input("Contractor Address")
-
-    st.header("🎨 Painting Details")
-    mfg_options = ["Benjamin Moore", "Sherwin Williams", "Miller", "Other"]
-
-    st.markdown("**Siding**")
-    r1c1, r1c2, r1c3 = st.columns(3)
-    siding_mfg = r1c1.selectbox("Siding Manufacturer", mfg_options, index=None, placeholder="Select...")
-    siding_id = r1c2.text_input("Color ID", key="s_id")
-    siding_name = r1c3.text_input("Color Name", key="s_name")
-
-    st.markdown("**Window Trim**")
-    r2c1, r2c2, r2c3 = st.columns(3)
-    trim_mfg = r2c1.selectbox("Trim Manufacturer", mfg_options, index=None, placeholder="Select...")
-    trim_id = r2c2.text_input("Color ID", key="t_id")
-    trim_name = r2c3.text_input("Color Name", key="t_name")
-
-    st.markdown("**Brickwork Trim**")
-    r3c1, r3c2, r3c3 = st.columns(3)
-    brickwork_mfg = r3c1.selectbox("Brickwork Manufacturer", mfg_options, index=None, placeholder="Select...")
-    brickwork_id = r3c2.text_input("Color ID", key="b_id")      
-    brickwork_name = r3c3.text_input("Color Name", key="b_name") 
-
-    st.markdown("**Shutters**")
-    r4c1, r4c2, r4c3 = st.columns(3)
-    shutter_mfg = r4c1.selectbox("Shutter Manufacturer", mfg_options, index=None, placeholder="Select...")
-    shutter_id = r4c2.text_input("Color ID", key="sh_id")    
-    shutter_name = r4c3.text_input("Color Name", key="sh_name") 
-
-    st.markdown("**Front Door**")
-    r5c1, r5c2, r5c3 = st.columns(3)
-    door_mfg = r5c1.selectbox("Front Door Manufacturer", mfg_options, index=None, placeholder="Select...")
-    door_id = r5c2.text_input("Color ID", key="d_id")      
-    door_name = r5c3.text_input("Color Name", key="d_name") 
-
-    st.markdown("**Fence**")
-    r6c1, r6c2, r6c3 = st.columns(3)
-    fence_mfg = r6c1.selectbox("Fence", mfg_options, index=None, placeholder="Select...")
-    fence_id = r6c2.text_input("Color ID", key="f_id")      
-    fence_name = r6c3.text_input("Color Name", key="f_name") 
-
-    st.markdown("**Other Items**")
-    c_other1, c_other2 = st.columns(2)
-    other_mfg = c_other1.text_input("Other Item Manufacturer")
-    other_color_name = c_other2.text_input("Other Item Color Name")
-
-    st.subheader("5. Samples")
-    samples_status = st.radio("Sample Status", ["Samples Placed", "Email ACC"], index=None)
-    samples_location = ""
-    if samples_status == "Samples Placed":
-        samples_location = st.text_input("Where are the samples located? (e.g. Front Porch)")
-
-    form_data.update({
-        "contractor_name": contractor_name, "contractor_address": contractor_address, "contractor_phone": contractor_phone,
-        "siding_mfg": siding_mfg, "siding_id": siding_id, "siding_name": siding_name,
-        "brickwork_mfg": brickwork_mfg, "brickwork_id": brickwork_id, "brickwork_name": brickwork_name,
-        "trim_mfg": trim_mfg, "trim_id": trim_id, "trim_name": trim_name,
-        "shutter_mfg": shutter_mfg, "shutter_id": shutter_id, "shutter_name": shutter_name,
-        "door_mfg": door_mfg, "door_id": door_id, "door_name": door_name,
-        "fence_mfg": fence_mfg, "fence_id": fence_id, "fence_name": fence_name,
-        "other_mfg": other_mfg, "other_color_name": other_color_name,
-        "samples_status": samples_status, "samples_location": samples_location
-    })
-
-# === REMODEL UI ===
-elif app_mode == "Remodel / Structure / Landscape":
-    st.subheader("3. Contractor Information")
-    c7, c8 = st.columns(2)
-    contractor_name = c7.text_input("Contractor Name")
-    contractor_phone = c8.text_input("Contractor Phone")
-    contractor_address = st.text_input("Contractor Address")
-
-    st.header("🔨 Project Details")
-    
-    with st.expander("External Home Remodel", expanded=True):
-        c_r1, c_r2, c_r3 = st.columns(3)
-        rem_room = c_r1.checkbox("Room Additions")
-        rem_win = c_r1.checkbox("Windows/Doors")
-        rem_mason = c_r1.checkbox("Masonry")
-        rem_deck = c_r2.checkbox("Deck or Patio")
-        rem_cover = c_r2.checkbox("Patio Cover")
-        rem_planter = c_r2.checkbox("Attached Planter")
-        rem_drive = c_r3.checkbox("Driveway Mod")
-        rem_retain = c_r3.checkbox("Retaining Wall (Attached)")
-
-    with st.expander("Free-Standing Structures"):
-        c_s1, c_s2, c_s3 = st.columns(3)
-        str_fence = c_s1.checkbox("New/Repl Fence")
-        str_bbq = c_s1.checkbox("Outdoor Fireplace/BBQ")
-        str_ac = c_s1.checkbox("AC Unit")
-        str_gen = c_s1.checkbox("Generator")
-        str_swing = c_s1.checkbox("Swing Set")
-        str_pool = c_s2.checkbox("Spa or Pool")
-        str_gazebo = c_s2.checkbox("Gazebo")
-        str_trellis = c_s2.checkbox("Arbor or Trellis")
-        str_hoop = c_s2.checkbox("Basketball Hoop")
-        str_gym = c_s2.checkbox("Jungle Gym")
-        str_wall = c_s3.checkbox("Masonry Wall")
-        str_green = c_s3.checkbox("Greenhouse")
-        str_shed = c_s3.checkbox("Garden Shed")
-        str_play = c_s3.checkbox("Playhouse")
-        str_tramp = c_s3.checkbox("Trampoline")
-
-    with st.expander("Landscaping"):
-        c_l1, c_l2, c_l3 = st.columns(3)
-        lnd_grade = c_l1.checkbox("Lawn/Garden Grade Change")
-        lnd_art = c_l1.checkbox("Artificial Turf")
-        lnd_retain = c_l2.checkbox("Retaining Wall (Landscape)")
-        lnd_tree_rem = c_l2.checkbox("Protected Tree Removal")
-        lnd_shrub = c_l3.checkbox("Trees/Shrubs <20' of Lake")
-        lnd_conserv = c_l3.checkbox("Conservancy Plant Removal")
-        
-    form_data.update({
-        "contractor_name": contractor_name, "contractor_address": contractor_address, "contractor_phone": contractor_phone,
-        "rem_room": rem_room, "rem_win": rem_win, "rem_mason": rem_mason,
-        "rem_deck": rem_deck, "rem_cover": rem_cover, "rem_planter": rem_planter,
-        "rem_drive": rem_drive, "rem_retain": rem_retain,
-        "str_fence": str_fence, "str_bbq": str_bbq, "str_ac": str_ac,
-        "str_gen": str_gen, "str_swing": str_swing,
-        "str_pool": str_pool, "str_gazebo": str_gazebo, "str_trellis": str_trellis,
-        "str_hoop": str_hoop, "str_gym": str_gym,
-        "str_wall": str_wall, "str_green": str_green, "str_shed": str_shed,
-        "str_play": str_play, "str_tramp": str_tramp,
-        "lnd_grade": lnd_grade, "lnd_art": lnd_art,
-        "lnd_retain": lnd_retain, "lnd_tree_rem": lnd_tree_rem,
-        "lnd_shrub": lnd_shrub, "lnd_conserv": lnd_conserv
-    })
-
-# === ROOFING UI ===
-elif app_mode == "Roofing":
-    st.header("🏠 Roofing Details")
-    
-    roof_action = st.radio("Select Roofing Action", ["Replacement", "Cleaning", "Tinting"])
-    
-    if roof_action == "Replacement":
-        st.info("Requirement: All replacement roofs shall utilize #1 sawn cedar shakes.")
-        st.subheader("Contractor Information (Replacement)")
-        contractor_name = st.text_input("Contractor Name")
-        contractor_phone = st.text_input("Contractor Phone")
-        contractor_address = st.text_input("Contractor Address")
-        form_data.update({
-            "contractor_name": contractor_name, "contractor_address": contractor_address, "contractor_phone": contractor_phone
-        })
-        
-    elif roof_action == "Cleaning":
-        st.subheader("Contractor Information (Cleaning)")
-        contractor_name = st.text_input("Contractor Name")
-        contractor_phone = st.text_input("Contractor Phone")
-        contractor_address = st.text_input("Contractor Address")
-        roof_clean_product = st.text_input("Product to be Used")
-        form_data.update({
-            "contractor_name": contractor_name, "contractor_address": contractor_address, "contractor_phone": contractor_phone,
-            "roof_clean_product": roof_clean_product
-        })
-        
-    elif roof_action == "Tinting":
-        st.subheader("Tinting Specs")
-        roof_tint_mfg = st.text_input("Manufacturer")
-        roof_tint_id = st.text_input("Color ID Number")
-        roof_tint_name = st.text_input("Color Name")
-        form_data.update({
-            "roof_tint_mfg": roof_tint_mfg, "roof_tint_id": roof_tint_id, "roof_tint_name": roof_tint_name
-        })
-        
-    form_data.update({"roof_action": roof_action})
-
-# === SOLAR UI ===
-elif app_mode == "Solar Energy Panel":
-    st.header("☀️ Solar Panel Details")
-    
-    st.subheader("3. Contractor / Installer")
-    c7, c8 = st.columns(2)
-    contractor_name = c7.text_input("Contractor Name")
-    contractor_phone = c8.text_input("Contractor Phone")
-    contractor_address = st.text_input("Contractor Address")
-    
-    st.subheader("4. Required Documents")
-    st.info("Please attach these documents to your final email submission:")
-    st.markdown("- **Drawings/Specifications**: Showing location, conduits, and compliance.")
-    st.markdown("- **Aerial View**: Showing proposed panel on roof.")
-    st.markdown("- **Manufacturer Specifications**: For the equipment.")
-    
-    form_data.update({
-        "contractor_name": contractor_name, 
-        "contractor_address": contractor_address, 
-        "contractor_phone": contractor_phone
-    })
-
-# --- SUBMISSION ---
-submitted = st.button("Generate Application PDF")
-
-if submitted:
+uploads = []
+
+# Sidebar items (the roofing action) switch which fields are shown, so they
+# live outside the form where changing them reruns immediately
+render_items(spec.sidebar, st.sidebar, form_data, uploads)
+
+# Inputs are only committed when the form is submitted, so typing into them
+# does not rerun the script
+with st.form("application_form"):
+    # --- COMMON FIELDS ---
+    st.subheader("1. Homeowner Information")
+    c1, c2 = st.columns(2)
+    owner_name = c1.text_input("Name")
+    lot_number = c2.text_input("Lot Number")
+    address = st.text_input("Address")
+    designated_contact = st.text_input("Designated Contact (if different)")
+
+    c3, c4 = st.columns(2)
+    home_phone = c3.text_input("Home Phone")
+    email = c4.text_input("Email")
+
+    st.subheader("2. Project Timeline")
+    c5, c6 = st.columns(2)
+    start_date = c5.date_input("Proposed Start Date")
+    end_date = c6.date_input("Est. Completion Date")
+
+    # --- APP SPECIFIC UI ---
+    render_items(spec.ui, st, form_data, uploads)
+
+    # --- SUBMISSION ---
+    small_file = st.checkbox("Smaller file for emailing", value=True,
+                             help="Same pages, with unused font data stripped out")
+    submitted = st.form_submit_button("Generate Application PDF")
+
+def spool_uploads(uploads):
+    """Writes each upload to a temporary file, so the job carries paths rather
+    than file bytes; returns (folder, paths)"""
+    folder = tempfile.mkdtemp(prefix="acc_uploads_")
+    paths = []
+    for i, upload in enumerate(uploads):
+        # One folder per upload keeps its own name, which errors report,
+        # even when two uploads share one
+        path = os.path.join(folder, str(i), os.path.basename(upload.name) or "upload")
+        os.mkdir(os.path.dirname(path))
+        upload.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(upload, f)
+        paths.append(path)
+    return folder, paths
+
+upload_bytes = sum(upload.size for upload in uploads)
+if submitted and upload_bytes > ATTACHMENT_MB * 1024 * 1024:
+    # Turned away before anything is copied or queued
+    st.error(f"Your supporting documents add up to {upload_bytes / 1024 / 1024:.1f} MB. "
+             f"Please keep them under {ATTACHMENT_MB} MB in all.")
+elif submitted:
     # Bundle Common Data
     form_data.update({
         "date_prepared": date.today().strftime("%B %d, %Y"),
@@ -495,24 +191,155 @@ if submitted:
         "start_date": start_date, "end_date": end_date,
     })
 
+    jobs = get_job_queue(JOBS_PATH, JOB_WORKERS)
+    st.session_state.pop("generated_pdf", None)
+    upload_dir, attachments = spool_uploads(uploads) if uploads else (None, [])
     try:
-        final_form_type = "Painting"
-        if app_mode == "Remodel / Structure / Landscape": final_form_type = "Remodel"
-        elif app_mode == "Roofing": final_form_type = "Roofing"
-        elif app_mode == "Solar Energy Panel": final_form_type = "Solar"
-        
-        final_pdf = generate_final_pdf(form_data, final_form_type)
-        out_buffer = io.BytesIO()
-        final_pdf.write(out_buffer)
-        
-        st.success(f"✅ {app_mode} Generated!")
+        # Generated on a worker thread; this session only polls for the result
+        job_id = jobs.submit("application", {
+            "form_type": spec.name, "form_data": form_data, "optimize": small_file,
+            "attachments": attachments, "upload_dir": upload_dir,
+        })
+    except QueueFull:
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+        st.error("Lots of applications are being generated right now. Please try again in a minute.")
+    else:
+        st.session_state["pending_job"] = {
+            "id": job_id,
+            "upload_dir": upload_dir,
+            "app_mode": app_mode,
+            "form_type": spec.name,
+            "form_data": dict(form_data),
+            "file_name": f"{app_mode.split()[0]}_App_{owner_name}.pdf",
+        }
+        # Most PDFs take well under a second, so skip the progress display for them
+        jobs.wait(job_id, SUBMIT_WAIT_SECONDS)
+
+@st.fragment(run_every=POLL_SECONDS)
+def show_job_progress(jobs, job_id, what="application PDF"):
+    """Reruns on its own every POLL_SECONDS until the job finishes, then reruns the page"""
+    job = jobs.get(job_id)
+    if job is None or job.status in (DONE, FAILED):
+        st.rerun()
+    stats = jobs.stats()
+    if job.status == RUNNING:
+        st.info(f"⏳ Generating your {what}...")
+    elif job.attempts:
+        st.warning(f"⏳ Retrying after a problem (attempt {job.attempts + 1} of {job.max_attempts})...")
+    else:
+        st.info(f"⏳ Waiting for a free worker, {jobs.position(job_id)} ahead of you...")
+    wait = stats["wait_ms"]
+    st.caption(f"{stats['queued']} waiting, {stats['running']} generating"
+               + (f"; typical wait {wait['p50'] / 1000:.1f} s" if wait else ""))
+
+pending = st.session_state.get("pending_job")
+if pending:
+    jobs = get_job_queue(JOBS_PATH, JOB_WORKERS)
+    # A finished job is handed over and forgotten by the queue, so its PDF
+    # is only held here, in session_state
+    job = jobs.collect(pending["id"]) or jobs.get(pending["id"])
+    if (job is None or job.status == FAILED) and pending.get("upload_dir"):
+        # The handler keeps the uploads after an error a retry might fix;
+        # there won't be another
+        shutil.rmtree(pending["upload_dir"], ignore_errors=True)
+    if job is None:
+        st.session_state.pop("pending_job")
+        st.error("Your application PDF is no longer available. Please submit it again.")
+    elif job.status == DONE:
+        st.session_state.pop("pending_job")
+        # Generated once per submit; reruns only re-serve these bytes
+        st.session_state["generated_pdf"] = {
+            "app_mode": pending["app_mode"],
+            "data": job.result,
+            "file_name": pending["file_name"],
+        }
+
+        # Remember each form for the household bundle; a different owner or
+        # lot starts a new household
+        data = pending["form_data"]
+        household = st.session_state.get("household", {})
+        if any((d.get("owner_name"), d.get("lot_number")) != (data.get("owner_name"), data.get("lot_number"))
+               for d in household.values()):
+            household = {}
+        household[pending["form_type"]] = data
+        st.session_state["household"] = household
+        st.session_state.pop("bundle_pdf", None)
+    elif job.status == FAILED:
+        st.session_state.pop("pending_job")
+        if job.error_type == "FileNotFoundError":
+            st.error(f"Error: {job.error}. Check your filenames!")
+        else:
+            st.error(f"An error occurred: {job.error}")
+    else:
+        show_job_progress(jobs, pending["id"])
+
+generated = st.session_state.get("generated_pdf")
+if generated and generated["app_mode"] == app_mode:
+    st.success(f"✅ {app_mode} Generated!")
+    st.download_button(
+        label="⬇️ Download PDF",
+        data=generated["data"],
+        file_name=generated["file_name"],
+        mime="application/pdf",
+        on_click="ignore"
+    )
+
+# ==========================================
+# 3. HOUSEHOLD BUNDLE
+# ==========================================
+household = st.session_state.get("household", {})
+if len(household) > 1:
+    st.divider()
+    st.subheader("📎 Household Bundle")
+    # Named for the household's owner, not whatever the form shows right now
+    household_owner = next(iter(household.values())).get("owner_name") or ""
+    st.caption(f"{', '.join(household)} for {household_owner or 'this lot'}, as one PDF")
+    forms_only = st.checkbox("Form pages only", help="Leave out the instruction pages")
+    if st.button("Generate Bundle PDF"):
+        jobs = get_job_queue(JOBS_PATH, JOB_WORKERS)
+        st.session_state.pop("bundle_pdf", None)
+        try:
+            job_id = jobs.submit("bundle", {
+                "forms": [[form_type, data] for form_type, data in household.items()],
+                "optimize": small_file, "form_pages_only": forms_only,
+            })
+        except QueueFull:
+            st.error("Lots of applications are being generated right now. Please try again in a minute.")
+        else:
+            st.session_state["pending_bundle"] = {
+                "id": job_id,
+                "forms_only": forms_only,
+                "file_name": f"Household_Apps_{household_owner}.pdf",
+            }
+            jobs.wait(job_id, SUBMIT_WAIT_SECONDS)
+
+    pending = st.session_state.get("pending_bundle")
+    if pending:
+        jobs = get_job_queue(JOBS_PATH, JOB_WORKERS)
+        job = jobs.collect(pending["id"]) or jobs.get(pending["id"])
+        if job is None:
+            st.session_state.pop("pending_bundle")
+            st.error("Your bundle PDF is no longer available. Please generate it again.")
+        elif job.status == DONE:
+            st.session_state.pop("pending_bundle")
+            st.session_state["bundle_pdf"] = {
+                "forms_only": pending["forms_only"],
+                "data": job.result,
+                "file_name": pending["file_name"],
+            }
+        elif job.status == FAILED:
+            st.session_state.pop("pending_bundle")
+            st.error(f"An error occurred: {job.error}")
+        else:
+            show_job_progress(jobs, pending["id"], "household bundle")
+
+    bundle = st.session_state.get("bundle_pdf")
+    if bundle and bundle["forms_only"] == forms_only:
         st.download_button(
-            label="⬇️ Download PDF",
-            data=out_buffer.getvalue(),
-            file_name=f"{app_mode.split()[0]}_App_{owner_name}.pdf",
-            mime="application/pdf"
+            label="⬇️ Download Bundle",
+            data=bundle["data"],
+            file_name=bundle["file_name"],
+            mime="application/pdf",
+            on_click="ignore"
         )
-    except FileNotFoundError as e:
-        st.error(f"Error: {e}. Check your filenames!")
-    except Exception as e:
-        st.error(f"An error occurred: {e}")
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local archive of generated Lakes HOA ACC applications
+
+Every generation can be recorded in one SQLite file: the normalized form_data,
+form type, mode, template hash and the PDF itself, so a past application can
+be found by lot, owner, form or date and downloaded again without running the
+pipeline.
+
+PDF bytes are content-addressed. A document is the list of its parts (the
+pieces splice_final_pdf returns, then the update adding any attachments, or
+the pieces of a household bundle) and each part is stored once, compressed,
+under its SHA-256. The template skeleton every spliced PDF starts with is
+therefore kept once per template, and an application costs only its own
+incremental update; generating the same application twice stores nothing new
+but the row.
+
+Standard library only, so lookups don't pay for importing the PDF engine.
+
+    python archive.py acc_archive.db find --lot 112
+    python archive.py acc_archive.db get 42 -o lot112.pdf
+"""
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+# ==========================================
+# 1. ARCHIVE
+# ==========================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    parts TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS applications (
+    id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    form_type TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    owner_name TEXT COLLATE NOCASE,
+    lot_number TEXT,
+    template_sha256 TEXT NOT NULL,
+    form_data TEXT NOT NULL,
+    pdf_sha256 TEXT NOT NULL REFERENCES documents(sha256)
+);
+CREATE INDEX IF NOT EXISTS applications_lot ON applications(lot_number, created);
+CREATE INDEX IF NOT EXISTS applications_owner ON applications(owner_name, created);
+CREATE INDEX IF NOT EXISTS applications_form ON applications(form_type, created);
+CREATE INDEX IF NOT EXISTS applications_created ON applications(created);
+"""
+
+COLUMNS = ("id", "created", "form_type", "mode", "owner_name", "lot_number",
+           "template_sha256", "pdf_sha256")
+
+# Parts are mostly Flate streams already; a light level is nearly as small
+COMPRESS_LEVEL = 6
+
+class Archive:
+    """SQLite store of generated applications, safe to share between threads.
+
+    One connection is shared behind a lock; with WAL, readers in other
+    processes (the CLI, batch workers) are not blocked while it writes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------
+    # Writing
+    # ------------------------------------------
+    def put(self, form_type, form_data, pdf, template_sha256, mode="splice", parts=None):
+        """Records one generation; returns its application id.
+
+        form_data should already be normalized (pdf_engine.normalize_form_data).
+        `parts`, when given, are the pieces `pdf` was joined from and are
+        stored separately so shared ones are kept once.
+        """
+        parts = parts or [pdf]
+        hashes = [hashlib.sha256(part).hexdigest() for part in parts]
+        if len(parts) == 1:
+            pdf_sha = hashes[0]
+        else:
+            whole = hashlib.sha256()
+            for part in parts:
+                whole.update(part)
+            pdf_sha = whole.hexdigest()
+        created = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+        with self._lock, self._conn:
+            known = self._conn.execute("SELECT 1 FROM documents WHERE sha256 = ?", (pdf_sha,)).fetchone()
+            if known is None:
+                for sha, part in zip(hashes, parts):
+                    if self._conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha,)).fetchone():
+                        continue
+                    self._conn.execute("INSERT OR IGNORE INTO blobs (sha256, size, data) VALUES (?, ?, ?)",
+                                       (sha, len(part), zlib.compress(part, COMPRESS_LEVEL)))
+                self._conn.execute("INSERT OR IGNORE INTO documents (sha256, size, parts) VALUES (?, ?, ?)",
+                                   (pdf_sha, sum(len(part) for part in parts), json.dumps(hashes)))
+            cursor = self._conn.execute(
+                "INSERT INTO applications (created, form_type, mode, owner_name, lot_number,"
+                " template_sha256, form_data, pdf_sha256) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (created, form_type, mode, form_data.get("owner_name"), form_data.get("lot_number"),
+                 template_sha256, json.dumps(form_data, sort_keys=True), pdf_sha))
+            return cursor.lastrowid
+
+    # ------------------------------------------
+    # Reading
+    # ------------------------------------------
+    def find(self, lot_number=None, owner_name=None, form_type=None, since=None, until=None, limit=50):
+        """Applications matching every filter given, newest first, without their PDFs.
+
+        owner_name matches case-insensitively from the start of the name;
+        since/until are dates or ISO strings compared against `created` (UTC).
+        """
+        clauses, params = [], []
+        if lot_number is not None:
+            clauses.append("lot_number = ?")
+            params.append(str(lot_number))
+        if owner_name:
+            clauses.append("owner_name LIKE ?")
+            params.append(owner_name.replace("%", "").replace("_", "") + "%")
+        if form_type:
+            clauses.append("form_type = ?")
+            params.append(form_type)
+        if since:
+            clauses.append("created >= ?")
+            params.append(str(since))
+        if until:
+            # A bare date means up to the end of that day
+            if len(str(until)) == 10:
+                until = date.fromisoformat(str(until)) + timedelta(days=1)
+            clauses.append("created < ?")
+            params.append(str(until))
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        sql = (f"SELECT {', '.join(COLUMNS)}, form_data FROM applications{where}"
+               " ORDER BY created DESC, id DESC LIMIT ?")
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit]).fetchall()
+        return [dict(row, form_data=json.loads(row["form_data"])) for row in rows]
+
+    def get(self, application_id):
+        """The application row with its form_data, or None"""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(COLUMNS)}, form_data FROM applications WHERE id = ?",
+                                     (application_id,)).fetchone()
+        return dict(row, form_data=json.loads(row["form_data"])) if row else None
+
+    def pdf(self, application_id):
+        """The archived PDF bytes of an application, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT documents.parts FROM applications JOIN documents"
+                " ON documents.sha256 = applications.pdf_sha256 WHERE applications.id = ?",
+                (application_id,)).fetchone()
+            if row is None:
+                return None
+            hashes = json.loads(row["parts"])
+            blobs = dict(self._conn.execute(
+                f"SELECT sha256, data FROM blobs WHERE sha256 IN ({', '.join('?' * len(hashes))})",
+                hashes).fetchall())
+        return b"".join(zlib.decompress(blobs[sha]) for sha in hashes)
+
+    def stats(self):
+        with self._lock:
+            applications = self._conn.execute("SELECT COUNT(*) FROM applications").fetchone()[0]
+            documents, pdf_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+            blobs, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs").fetchone()
+        return {"applications": applications, "documents": documents, "pdf_bytes": pdf_bytes,
+                "blobs": blobs, "stored_bytes": stored}
+
+# ==========================================
+# 2. CLI
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up archived ACC applications")
+    parser.add_argument("path", help="archive database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    find = commands.add_parser("find", help="list matching applications, newest first")
+    find.add_argument("--lot", dest="lot_number")
+    find.add_argument("--owner", dest="owner_name", help="start of the owner's name, any case")
+    find.add_argument("--form", dest="form_type")
+    find.add_argument("--since", help="YYYY-MM-DD")
+    find.add_argument("--until", help="YYYY-MM-DD, inclusive")
+    find.add_argument("--limit", type=int, default=50)
+    get = commands.add_parser("get", help="write an application's PDF")
+    get.add_argument("id", type=int)
+    get.add_argument("-o", "--output", help="default: <id>_<form>_<lot>.pdf")
+    commands.add_parser("stats", help="rows and bytes stored")
+    args = parser.parse_args(argv)
+
+    archive = Archive(args.path)
+    started = time.perf_counter()
+    if args.command == "find":
+        rows = archive.find(args.lot_number, args.owner_name, args.form_type, args.since, args.until,
+                            args.limit)
+        for row in rows:
+            print(f"{row['id']:>6}  {row['created'][:19]}  {row['form_type']:<9} lot {row['lot_number'] or '-':<6}"
+                  f" {row['owner_name'] or ''}")
+        print(f"{len(rows)} found in {(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+    elif args.command == "get":
+        row = archive.get(args.id)
+        if row is None:
+            print(f"No application {args.id}", file=sys.stderr)
+            return 1
+        pdf = archive.pdf(args.id)
+        path = args.output or f"{row['id']}_{row['form_type']}_{row['lot_number'] or 'lot'}.pdf"
+        with open(path, "wb") as f:
+            f.write(pdf)
+        print(f"Wrote {path} ({len(pdf):,} bytes) in {(time.perf_counter() - started) * 1000:.1f} ms",
+              file=sys.stderr)
+    else:
+        print(json.dumps(archive.stats(), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Supporting documents for the Lakes HOA ACC applications
+
+Solar and Remodel applications go out with drawings, aerial views, photos and
+manufacturer specs. append_attachments adds them to the generated PDF as extra
+pages, so everything the ACC needs is one file.
+
+The application itself is not rewritten; only its trailer and page tree root
+are read. The attachments become one more incremental update after it,
+written a page at a time:
+
+  * images are decoded at reduced scale where the format allows it (JPEG
+    draft mode), downscaled to ATTACHMENT_DPI on a letter page and
+    re-encoded as JPEG on a small thread pool, a few ahead of the writer
+  * PDFs are copied page by page; only the objects a page uses are read, and
+    the reader's cache is dropped after each page
+  * every page is checked against max_bytes before it is written, so an
+    oversized upload fails with AttachmentTooLarge instead of being buffered
+
+An attachment is a path or a binary file object (a Streamlit UploadedFile,
+an open file). Its type is taken from its first bytes, not its name.
+"""
+import io
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+from pypdf.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, IndirectObject,
+                           NameObject, NumberObject, StreamObject)
+from optimize import JPEG_QUALITY, write_object, xref_stream
+
+# Bytes the attachments may add to the application, all together
+MAX_ATTACHMENT_BYTES = 20 * 1024 * 1024
+# Resolution images are kept at, fitted inside the page margins
+ATTACHMENT_DPI = 150
+# Images being decoded and re-encoded at once
+IMAGE_WORKERS = min(4, os.cpu_count() or 1)
+
+LETTER = (612, 792)
+MARGIN = 36
+
+# Page attributes a page can inherit from its /Pages parents
+INHERITED = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+# Page entries that point back into the source document
+DROPPED = ("/Parent", "/Annots", "/B", "/StructParents", "/Thumb", "/PieceInfo", "/Metadata")
+
+class AttachmentTooLarge(ValueError):
+    """The attachments would take the file past its size cap"""
+
+class UnreadableAttachment(ValueError):
+    """An attachment that is neither a readable image nor a readable PDF"""
+
+def _label(source):
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", None)
+    return f"{os.path.basename(name)!r}" if name else "An attachment"
+
+# ==========================================
+# 1. IMAGES
+# ==========================================
+def _kind(source):
+    """"pdf" or "image", from the first bytes of a path or file object"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            head = f.read(5)
+    else:
+        position = source.tell()
+        head = source.read(5)
+        source.seek(position)
+    return "pdf" if head.startswith(b"%PDF-") else "image"
+
+def prepare_image(source, dpi=ATTACHMENT_DPI):
+    """(JPEG bytes, (width, height), PDF colour space, landscape) of one image,
+    sized to fill a letter page inside the margins at `dpi`"""
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(source) as image:
+            # The long side never needs more than this many pixels
+            longest = round((LETTER[1] - 2 * MARGIN) / 72 * dpi)
+            # JPEGs decode straight to a power-of-two reduction of this size or
+            # more, so a 12 MP photo never exists in memory at full size
+            image.draft("RGB", (longest, longest))
+            image = ImageOps.exif_transpose(image)
+            landscape = image.width > image.height
+            page_w, page_h = LETTER[::-1] if landscape else LETTER
+            box = (round((page_w - 2 * MARGIN) / 72 * dpi), round((page_h - 2 * MARGIN) / 72 * dpi))
+
+            if image.mode in ("RGBA", "LA", "P") or "transparency" in image.info:
+                # JPEG has no alpha; flatten onto white paper
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, "white")
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            elif image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.thumbnail(box, Image.LANCZOS)
+
+            out = io.BytesIO()
+            image.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+            colorspace = "/DeviceGray" if image.mode == "L" else "/DeviceRGB"
+            return out.getvalue(), image.size, colorspace, landscape
+    except (FileNotFoundError, PermissionError):
+        raise
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        # Pillow's errors for a file that isn't an image, or is a damaged one
+        raise UnreadableAttachment(f"{_label(source)} isn't a readable image or PDF") from e
+
+def _prepared(attachments, workers, dpi):
+    """Yields (kind, source or prepared image) in order, with up to `workers`
+    images being prepared ahead of the one yielded"""
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attach")
+    pending = deque()
+    try:
+        for source in attachments:
+            kind = _kind(source)
+            pending.append((kind, pool.submit(prepare_image, source, dpi) if kind == "image" else source))
+            while len(pending) > workers:
+                kind, item = pending.popleft()
+                yield kind, item.result() if kind == "image" else item
+        while pending:
+            kind, item = pending.popleft()
+            yield kind, item.result() if kind == "image" else item
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+# ==========================================
+# 2. INCREMENTAL UPDATE
+# ==========================================
+class _Update:
+    """The objects of an incremental update, emitted a page at a time.
+
+    Objects of the page being built are held until commit(), which checks
+    the cap first; nothing else is kept but their offsets.
+    """
+    def __init__(self, emit, base_len, next_id, max_bytes):
+        self.emit = emit
+        self.base_len = base_len
+        self.next_id = next_id
+        self.max_bytes = max_bytes
+        self.offsets = {}
+        self.written = 0
+        self._page = io.BytesIO()
+        self._page_offsets = {}
+
+    def reserve(self):
+        ref = IndirectObject(self.next_id, 0, None)
+        self.next_id += 1
+        return ref
+
+    def add(self, obj, ref=None):
+        ref = ref or self.reserve()
+        self._page_offsets[ref.idnum] = self.written + write_object(self._page, ref.idnum, obj)
+        return ref
+
+    def commit(self):
+        data = self._page.getvalue()
+        if self.written + len(data) > self.max_bytes:
+            raise AttachmentTooLarge(
+                f"Attachments are over the {self.max_bytes / (1024 * 1024):.0f} MB limit")
+        for idnum, offset in self._page_offsets.items():
+            self.offsets[idnum] = self.base_len + offset
+        self.emit(data)
+        self.written += len(data)
+        self._page = io.BytesIO()
+        self._page_offsets = {}
+
+    def write_raw(self, idnum, obj):
+        """Writes obj straight out, outside the cap (the update's own bookkeeping)"""
+        out = io.BytesIO()
+        write_object(out, idnum, obj)
+        self.offsets[idnum] = self.base_len + self.written
+        self.emit(out.getvalue())
+        self.written += out.tell()
+
+def _image_page(update, pages_ref, prepared):
+    jpeg, (width, height), colorspace, landscape = prepared
+    page_w, page_h = LETTER[::-1] if landscape else LETTER
+    scale = min((page_w - 2 * MARGIN) / width, (page_h - 2 * MARGIN) / height)
+    draw_w, draw_h = width * scale, height * scale
+
+    image = StreamObject()
+    image._data = jpeg
+    image.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(width),
+        NameObject("/Height"): NumberObject(height),
+        NameObject("/ColorSpace"): NameObject(colorspace),
+        NameObject("/BitsPerComponent"): NumberObject(8),
+        NameObject("/Filter"): NameObject("/DCTDecode"),
+    })
+    contents = DecodedStreamObject()
+    contents.set_data(b"q %.2f 0 0 %.2f %.2f %.2f cm /Im0 Do Q" % (
+        draw_w, draw_h, (page_w - draw_w) / 2, (page_h - draw_h) / 2))
+
+    page = DictionaryObject({
+        NameObject("/Type"): NameObject("/Page"),
+        NameObject("/Parent"): pages_ref,
+        NameObject("/MediaBox"): ArrayObject([NumberObject(0), NumberObject(0),
+                                              NumberObject(page_w), NumberObject(page_h)]),
+        NameObject("/Resources"): DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): update.add(image)}),
+        }),
+        NameObject("/Contents"): update.add(contents.flate_encode()),
+    })
+    ref = update.add(page)
+    update.commit()
+    return ref
+
+def _copy(obj, update, mapping):
+    """obj with every indirect reference renumbered into the update, writing
+    each referenced object the first time it is met"""
+    if isinstance(obj, IndirectObject):
+        ref = mapping.get(obj.idnum)
+        if ref is None:
+            ref = mapping[obj.idnum] = update.reserve()
+            update.add(_copy(obj.get_object(), update, mapping), ref)
+        return ref
+    if isinstance(obj, StreamObject):
+        copied = obj.__class__()
+        copied._data = obj._data
+        for key, value in obj.items():
+            if key != "/Length":
+                copied[NameObject(key)] = _copy(value, update, mapping)
+        return copied
+    if isinstance(obj, DictionaryObject):
+        return DictionaryObject({NameObject(key): _copy(value, update, mapping) for key, value in obj.items()})
+    if isinstance(obj, ArrayObject):
+        return ArrayObject(_copy(value, update, mapping) for value in obj)
+    return obj
+
+def _pdf_pages(update, pages_ref, source):
+    """Copies every page of a PDF attachment; yields the new page references"""
+    try:
+        yield from _copy_pages(update, pages_ref, source)
+    except PyPdfError as e:
+        raise UnreadableAttachment(f"{_label(source)} is a damaged PDF ({e})") from e
+
+def _copy_pages(update, pages_ref, source):
+    reader = PdfReader(source)
+    if reader.is_encrypted and not reader.decrypt(""):
+        raise ValueError("Password-protected PDFs can't be attached")
+    # Objects shared between pages (fonts, images) are written once
+    mapping = {}
+    for index in range(len(reader.pages)):
+        page = reader.pages[index]
+        entries = {key: page.raw_get(key) for key in page if key not in DROPPED}
+        for key in INHERITED:
+            node = page
+            while key not in node and "/Parent" in node:
+                node = node["/Parent"].get_object()
+            if key in node and key not in entries:
+                entries[key] = node.raw_get(key)
+        copied = _copy(DictionaryObject(entries), update, mapping)
+        copied[NameObject("/Parent")] = pages_ref
+        ref = update.add(copied)
+        update.commit()
+        # What is written is referenced through `mapping`; nothing read needs keeping
+        reader.resolved_objects.clear()
+        yield ref
+
+# ==========================================
+# 3. DRIVER
+# ==========================================
+def append_attachments(pdf, attachments, emit, max_bytes=MAX_ATTACHMENT_BYTES,
+                       workers=IMAGE_WORKERS, dpi=ATTACHMENT_DPI):
+    """Emits `pdf`, then an update adding every attachment after its last
+    page; returns the bytes written.
+
+    Raises AttachmentTooLarge once the attachments pass max_bytes,
+    UnreadableAttachment for one that is damaged or neither an image nor a
+    PDF, and ValueError for a PDF that can't be opened without a password.
+    """
+    reader = PdfReader(io.BytesIO(pdf))
+    xref_offset = int(pdf[pdf.rindex(b"startxref") + 9:].split()[0])
+    uses_stream = not pdf.startswith(b"xref", xref_offset)
+    pages_ref = reader.trailer["/Root"].raw_get("/Pages")
+    pages = DictionaryObject(pages_ref.get_object())
+    trailer = DictionaryObject({NameObject(key): reader.trailer.raw_get(key)
+                                for key in ("/Root", "/Info", "/ID") if key in reader.trailer})
+
+    emit(pdf)
+    if not attachments:
+        return len(pdf)
+    # The update starts on a line of its own
+    emit(b"\n")
+    update = _Update(emit, len(pdf) + 1, int(reader.trailer["/Size"]), max_bytes)
+
+    added = []
+    for kind, item in _prepared(attachments, workers, dpi):
+        if kind == "image":
+            added.append(_image_page(update, pages_ref, item))
+        else:
+            added.extend(_pdf_pages(update, pages_ref, item))
+
+    # New pages hang off the root of the page tree, after everything else
+    pages[NameObject("/Kids")] = ArrayObject(list(pages["/Kids"]) + added)
+    pages[NameObject("/Count")] = NumberObject(int(pages["/Count"]) + len(added))
+    update.write_raw(pages_ref.idnum, pages)
+
+    trailer[NameObject("/Prev")] = NumberObject(xref_offset)
+    xref_id = update.next_id
+    if uses_stream:
+        entries = {idnum: (1, offset, 0) for idnum, offset in update.offsets.items()}
+        entries[xref_id] = (1, update.base_len + update.written, 0)
+        start = update.base_len + update.written
+        update.write_raw(xref_id, xref_stream(entries, xref_id + 1, trailer))
+        tail = b"startxref\n%d\n%%%%EOF\n" % start
+    else:
+        start = update.base_len + update.written
+        out = io.BytesIO()
+        out.write(b"xref\n0 1\n0000000000 65535 f \n")
+        for idnum in sorted(update.offsets):
+            out.write(b"%d 1\n%010d 00000 n \n" % (idnum, update.offsets[idnum]))
+        trailer[NameObject("/Size")] = NumberObject(xref_id)
+        out.write(b"trailer\n")
+        trailer.write_to_stream(out)
+        out.write(b"\nstartxref\n%d\n%%%%EOF\n" % start)
+        tail = out.getvalue()
+    emit(tail)
+    return update.base_len + update.written + len(tail)
+
+def with_attachments(pdf, attachments, **options):
+    """append_attachments collected into bytes, for callers that need the whole file"""
+    chunks = []
+    append_attachments(pdf, attachments, chunks.append, **options)
+    return b"".join(chunks)
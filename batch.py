@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch generation of Lakes HOA ACC applications
+
+Reads form_data records from a JSONL or CSV file and writes one PDF per record
+plus a manifest.json, fanning the records out over a process pool.
+
+Each record needs a "form_type" (Painting, Remodel, Roofing, Solar). In JSONL
+the fields may be flat or nested under "form_data"; in CSV they are columns.
+A JSONL record may also list "attachments": image or PDF paths, relative to
+the input file, added after the application (see attachments.py). A JSONL
+line that isn't a JSON object fails on its own, like any other bad record:
+manifest.json lists it by line number and the rest are still generated.
+
+    python batch.py applications.jsonl -o out/ --workers 8
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import argparse
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+
+import pdf_engine
+from archive import Archive
+from attachments import append_attachments
+from forms import FORMS
+
+TRUE_STRINGS = {"1", "true", "yes", "y", "x"}
+
+class BadRecord(ValueError):
+    """A line of the input that isn't a record; it fails alone, in the manifest"""
+
+# ==========================================
+# 1. INPUT
+# ==========================================
+# Readers yield (line number, form_type, form_data) per record; for a line
+# that can't be read as one, form_data is the BadRecord saying why
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("a record must be a JSON object")
+            except ValueError as e:
+                yield number, None, BadRecord(str(e))
+                continue
+            form_data = dict(record.get("form_data") or record)
+            form_data.pop("form_data", None)
+            form_type = record.get("form_type") or form_data.get("form_type")
+            form_data.pop("form_type", None)
+            attachments = record.get("attachments") or form_data.get("attachments")
+            if attachments:
+                base = os.path.dirname(os.path.abspath(path))
+                form_data["attachments"] = [os.path.join(base, name) for name in attachments]
+            yield number, form_type, form_data
+
+def check_keys():
+    """Checkbox keys of every registered form, so CSV "true"/"false" become
+    booleans and text stays text"""
+    return {key for spec in FORMS.values() for fields in spec.compiled
+            for is_check, _, _, key, _ in fields if is_check}
+
+def read_csv(path):
+    check = check_keys()
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            form_type = row.pop("form_type", None)
+            form_data = {}
+            for key, value in row.items():
+                value = (value or "").strip()
+                if key in check:
+                    value = value.lower() in TRUE_STRINGS
+                form_data[key] = value
+            yield reader.line_num, form_type, form_data
+
+def read_records(path):
+    if path.lower().endswith(".csv"):
+        return read_csv(path)
+    return read_jsonl(path)
+
+# ==========================================
+# 2. WORKER
+# ==========================================
+# This worker's connection to the archive, when there is one
+ARCHIVE = None
+
+def init_worker(optimize=False, image_dpi=None, archive_path=None):
+    """Parses every template once per worker process, not once per record"""
+    global ARCHIVE
+    pdf_engine.TEMPLATES.image_dpi = image_dpi
+    pdf_engine.warm_templates(optimize=optimize)
+    if archive_path:
+        ARCHIVE = Archive(archive_path)
+
+def output_name(index, form_type, form_data):
+    owner = re.sub(r"[^A-Za-z0-9]+", "_", str(form_data.get("owner_name") or "")).strip("_")
+    return f"{index:05d}_{form_type}_{owner or 'Unknown'}.pdf"
+
+def generate_one(job):
+    index, line, form_type, form_data, out_dir, optimize, mode = job
+    row = {"index": index, "line": line, "form_type": form_type, "owner_name": form_data.get("owner_name"),
+           "lot_number": form_data.get("lot_number")}
+    started = time.perf_counter()
+    path = None
+    try:
+        if form_type not in pdf_engine.FORMS:
+            raise ValueError(f"Unknown form_type {form_type!r}")
+        form_data.setdefault("date_prepared", date.today().strftime("%B %d, %Y"))
+        attachments = form_data.pop("attachments", None)
+        path = os.path.join(out_dir, output_name(index, form_type, form_data))
+        with open(path, "wb") as f:
+            if ARCHIVE is None and not attachments:
+                size = pdf_engine.stream_final_pdf(form_data, form_type, f.write, mode=mode, optimize=optimize)
+            elif ARCHIVE is None:
+                pdf = pdf_engine.generate_pdf_bytes(form_data, form_type, mode=mode, optimize=optimize)
+                size = append_attachments(pdf, attachments, f.write)
+            else:
+                # The archive keeps the file as written, attachments included
+                pdf = pdf_engine.generate_pdf_bytes(form_data, form_type, mode=mode, optimize=optimize,
+                                                    archive=ARCHIVE, attachments=attachments)
+                f.write(pdf)
+                size = len(pdf)
+        row.update(status="ok", file=os.path.basename(path), bytes=size)
+        if attachments:
+            row["attachments"] = len(attachments)
+    except Exception as e:
+        row.update(status="error", error=f"{type(e).__name__}: {e}")
+        # Don't leave half a PDF behind
+        if path and os.path.exists(path):
+            os.remove(path)
+    row["seconds"] = round(time.perf_counter() - started, 4)
+    return row
+
+# ==========================================
+# 3. DRIVER
+# ==========================================
+def run_batch(input_path, out_dir, workers=None, chunksize=16, optimize=False, image_dpi=None,
+              mode="splice", archive_path=None):
+    """Generates every record in input_path into out_dir; returns the manifest"""
+    os.makedirs(out_dir, exist_ok=True)
+    jobs, rows = [], []
+    for i, (line, form_type, form_data) in enumerate(read_records(input_path)):
+        if isinstance(form_data, BadRecord):
+            rows.append({"index": i, "line": line, "form_type": None, "status": "error",
+                         "error": f"{type(form_data).__name__}: {form_data}", "seconds": 0})
+        else:
+            jobs.append((i, line, form_type, form_data, out_dir, optimize, mode))
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(optimize, image_dpi, archive_path)) as pool:
+        rows.extend(pool.map(generate_one, jobs, chunksize=chunksize))
+    rows.sort(key=lambda row: row["index"])
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in rows if r["status"] == "ok"]
+    manifest = {
+        "input": os.path.abspath(input_path),
+        "mode": mode,
+        "records": len(rows),
+        "ok": len(ok),
+        "failed": len(rows) - len(ok),
+        "elapsed_seconds": round(elapsed, 3),
+        "records_per_second": round(len(rows) / elapsed, 2) if elapsed else None,
+        "total_bytes": sum(r["bytes"] for r in ok),
+        "results": rows,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate ACC application PDFs in bulk")
+    parser.add_argument("input", help="JSONL or CSV file of form_data records")
+    parser.add_argument("-o", "--out-dir", default="batch_output")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="default: CPU count")
+    parser.add_argument("--chunksize", type=int, default=16)
+    parser.add_argument("--optimize", action="store_true", help="write size-optimized PDFs (see optimize.py)")
+    parser.add_argument("--image-dpi", type=int, default=None,
+                        help="with --optimize, downsample images drawn above this DPI")
+    parser.add_argument("--mode", default="splice",
+                        choices=["splice", "merge"] + sorted(pdf_engine.FILL_MODES),
+                        help="how to assemble each PDF; acroform keeps the fields fillable")
+    parser.add_argument("--archive", help="also record every PDF in this archive database (see archive.py)")
+    args = parser.parse_args(argv)
+
+    manifest = run_batch(args.input, args.out_dir, args.workers, args.chunksize,
+                         args.optimize, args.image_dpi, args.mode, args.archive)
+    print(f"{manifest['ok']}/{manifest['records']} generated in {manifest['elapsed_seconds']}s "
+          f"({manifest['records_per_second']} records/s), {manifest['failed']} failed")
+    for row in manifest["results"]:
+        if row["status"] != "ok":
+            print(f"  #{row['index']} (line {row['line']}) {row['form_type']}: {row['error']}", file=sys.stderr)
+    return 1 if manifest["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
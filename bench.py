@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the Lakes HOA ACC PDF pipeline
+
+Runs synthetic form_data through each stage of generation for every
+registered form and every branch of its layout (Roofing once per
+roof_action, Painting once per samples_status; see forms.layout_branches)
+with empty, typical and fully populated records, and reports latency
+percentiles, peak memory and output bytes:
+
+    overlay            render_overlay (reportlab canvas)
+    parse              reading a template from bytes into a fresh PdfReader
+    merge              merge_final_pdf on the cached template
+    write              PdfWriter.write of the merged document
+    splice             splice_final_pdf, what the app serves by default
+    splice_optimized   the same on the optimized template
+    acroform           fill_final_pdf into the template's form fields, written out
+    acroform_flat      the same, flattened
+
+Timings are taken with tracemalloc off; peak memory comes from a separate
+traced pass. Results are written as JSON and can be checked against an
+earlier run:
+
+    python bench.py -n 50 -o baseline.json
+    python bench.py -n 50 --baseline baseline.json
+"""
+import io
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+from datetime import datetime, timezone
+
+import pypdf
+import reportlab
+
+import pdf_engine
+from forms import layout_branches
+
+STAGES = ("overlay", "parse", "merge", "write", "splice", "splice_optimized", "acroform", "acroform_flat")
+PROFILES = ("empty", "typical", "full")
+
+# ==========================================
+# 1. SYNTHETIC FORM DATA
+# ==========================================
+FIRST = ["Maria", "James", "Aiyana", "Wei", "Priya", "Tomás", "Grace", "Olu"]
+LAST = ["Garcia", "Nguyen", "Okafor", "Schmidt", "Patel", "O'Brien", "Kowalski"]
+STREETS = ["Lakeview Dr", "Heron Ct", "Cypress Bend", "Willow Way", "Marina Blvd"]
+COLORS = ["Agreeable Gray", "Alabaster", "Tricorn Black", "Sea Salt", "Naval"]
+MAKERS = ["Sherwin-Williams", "Benjamin Moore", "Behr", "PPG"]
+
+def _value(key, rng, full):
+    """A plausible value for a form_data key; `full` makes it as long as a field allows"""
+    if key == "owner_name" or key == "designated_contact":
+        value = f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+    elif key == "lot_number":
+        value = str(rng.randint(1, 480))
+    elif key.endswith("address"):
+        value = f"{rng.randint(100, 9999)} {rng.choice(STREETS)}"
+    elif key.endswith("phone"):
+        value = f"({rng.randint(200, 989)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}"
+    elif key == "email":
+        value = f"{rng.choice(FIRST).lower()}.{rng.randint(1, 99)}@example.com"
+    elif key.endswith("_date") or key == "date_prepared":
+        value = f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    elif key.endswith("_mfg"):
+        value = rng.choice(MAKERS)
+    elif key.endswith("_id"):
+        value = f"SW {rng.randint(6000, 9999)}"
+    else:
+        value = rng.choice(COLORS)
+    if full:
+        value = (value + " - " + "x" * 40)[:48]
+    return value
+
+def synthetic_record(form_type, profile, rng, **fixed):
+    """form_data for one form at one fill level.
+
+    empty has only the switches in `fixed` (roof_action, samples_status);
+    typical fills the contact block and about half of everything else;
+    full fills every field the layout can draw.
+    """
+    data = dict(fixed)
+    if profile == "empty":
+        return data
+    # A key can sit in several branches (the Roofing contractor boxes); it is
+    # filled from the first entry whose condition holds
+    seen = set()
+    for is_check, key, when in _layout_fields(form_type):
+        if key in fixed or key in seen or (when and fixed.get(when[0]) != when[1]):
+            continue
+        seen.add(key)
+        core = key in ("owner_name", "lot_number", "address", "email", "date_prepared")
+        if profile == "typical" and not core and rng.random() < 0.5:
+            continue
+        data[key] = True if is_check else _value(key, rng, profile == "full")
+    return data
+
+def _layout_fields(form_type):
+    for fields in pdf_engine.FORMS[form_type].compiled:
+        for is_check, _, _, key, when in fields:
+            yield is_check, key, when
+
+def bench_cases(seed=2024):
+    """Every (case name, form type, form_data) the suite runs"""
+    rng = random.Random(seed)
+    cases = []
+    for form_type, spec in pdf_engine.FORMS.items():
+        # Named by the first word of each switch value: Roofing-Cleaning, Painting-Email
+        variants = [(form_type + "".join("-" + str(value).split()[0] for value in branch.values()), branch)
+                    for branch in layout_branches(spec.compiled)]
+        for name, fixed in variants:
+            for profile in PROFILES:
+                cases.append((f"{name}/{profile}", form_type,
+                              synthetic_record(form_type, profile, rng, **fixed)))
+    return cases
+
+# ==========================================
+# 2. STAGES
+# ==========================================
+def run_stage(stage, form_type, data, templates):
+    """Runs one stage once; returns (seconds, bytes out)"""
+    spec = pdf_engine.FORMS[form_type]
+    src, compiled = spec.template, spec.compiled
+    if stage == "overlay":
+        started = time.perf_counter()
+        overlay = pdf_engine.render_overlay(compiled, data)
+        return time.perf_counter() - started, overlay.getbuffer().nbytes
+    if stage == "parse":
+        raw = templates.get(src).data
+        started = time.perf_counter()
+        reader = pypdf.PdfReader(io.BytesIO(raw))
+        for page in reader.pages:
+            page.get_contents()
+        return time.perf_counter() - started, len(raw)
+    if stage in ("merge", "write"):
+        template = templates.get(src)
+        overlay = pdf_engine.render_overlay(compiled, data)
+        started = time.perf_counter()
+        writer = pdf_engine.merge_final_pdf(overlay, form_type, template)
+        merged = time.perf_counter()
+        if stage == "merge":
+            return merged - started, 0
+        out = io.BytesIO()
+        writer.write(out)
+        return time.perf_counter() - merged, out.getbuffer().nbytes
+    if stage in ("acroform", "acroform_flat"):
+        started = time.perf_counter()
+        out = io.BytesIO()
+        pdf_engine.fill_final_pdf(data, form_type, templates, flatten=stage == "acroform_flat").write(out)
+        return time.perf_counter() - started, out.getbuffer().nbytes
+    optimize = stage == "splice_optimized"
+    started = time.perf_counter()
+    parts = pdf_engine.splice_final_pdf(data, form_type, templates, optimize)
+    return time.perf_counter() - started, sum(len(part) for part in parts)
+
+def percentile(sorted_values, pct):
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+def summarize(seconds, peak_bytes, size):
+    ms = sorted(s * 1000 for s in seconds)
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 4),
+        "min_ms": round(ms[0], 4),
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p90_ms": round(percentile(ms, 90), 4),
+        "p95_ms": round(percentile(ms, 95), 4),
+        "p99_ms": round(percentile(ms, 99), 4),
+        "max_ms": round(ms[-1], 4),
+        "peak_bytes": peak_bytes,
+        "bytes_out": size,
+    }
+
+def run_suite(iterations=30, warmup=3, stages=STAGES, forms=None, seed=2024):
+    """Runs every case through every stage; returns the results document"""
+    templates = pdf_engine.TemplateCache()
+    pdf_engine.warm_templates(templates)
+    if "splice_optimized" in stages:
+        pdf_engine.warm_templates(templates, optimize=True)
+    if "acroform" in stages or "acroform_flat" in stages:
+        for spec in pdf_engine.FORMS.values():
+            templates.get(spec.template).with_fields(spec)
+
+    results = {}
+    for name, form_type, data in bench_cases(seed):
+        if forms and form_type not in forms:
+            continue
+        results[name] = {}
+        for stage in stages:
+            for _ in range(warmup):
+                run_stage(stage, form_type, data, templates)
+            seconds = []
+            for _ in range(iterations):
+                elapsed, size = run_stage(stage, form_type, data, templates)
+                seconds.append(elapsed)
+            with pdf_engine.peak_memory() as mem:
+                run_stage(stage, form_type, data, templates)
+            results[name][stage] = summarize(seconds, mem["peak_bytes"], size)
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pypdf": pypdf.__version__,
+            "reportlab": reportlab.Version,
+            "iterations": iterations,
+            "warmup": warmup,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+# ==========================================
+# 3. REPORTING
+# ==========================================
+def compare(current, baseline, metric="p50_ms", tolerance=0.2):
+    """Rows of (case, stage, old, new, ratio, regressed) for cases in both runs"""
+    rows = []
+    for name, stages in current["results"].items():
+        old_stages = baseline.get("results", {}).get(name, {})
+        for stage, summary in stages.items():
+            old = old_stages.get(stage, {}).get(metric)
+            new = summary.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            rows.append((name, stage, old, new, ratio, ratio > 1 + tolerance))
+    return rows
+
+def print_results(doc):
+    print(f"{'case':<30}{'stage':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'peak KB':>10}{'bytes':>10}")
+    for name, stages in doc["results"].items():
+        for stage, s in stages.items():
+            print(f"{name:<30}{stage:<18}{s['p50_ms']:>9.3f}{s['p95_ms']:>9.3f}{s['p99_ms']:>9.3f}"
+                  f"{s['peak_bytes'] / 1024:>10.1f}{s['bytes_out']:>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark overlay rendering and PDF assembly")
+    parser.add_argument("-n", "--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--forms", nargs="+", choices=sorted(pdf_engine.FORMS), default=None)
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("-o", "--output", default="bench_results.json", help="where to save the JSON results")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--metric", default="p50_ms", help="summary field compared to the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown ratio over baseline that counts as a regression")
+    args = parser.parse_args(argv)
+
+    doc = run_suite(args.iterations, args.warmup, args.stages, args.forms, args.seed)
+    print_results(doc)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
+    print(f"\nSaved {args.output}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(doc, baseline, args.metric, args.tolerance)
+    regressed = [row for row in rows if row[5]]
+    print(f"\nAgainst {args.baseline} ({args.metric}, tolerance {args.tolerance:.0%}):")
+    for name, stage, old, new, ratio, bad in rows:
+        if bad or ratio < 1 - args.tolerance:
+            print(f"  {'SLOWER' if bad else 'faster'} {name} {stage}: {old:.3f} -> {new:.3f} ({ratio:.2f}x)")
+    print(f"  {len(regressed)} of {len(rows)} stage timings regressed")
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registry of the Lakes HOA ACC application forms
+
+Each form is described once by a FormSpec: its template PDF, which template
+page each overlay page lands on, its field layout (layouts.py), the pages that
+are only instructions, and the UI the app shows for it. pdf_engine, app.py,
+batch.py and server.py all look forms up here.
+
+The four built-in forms are registered below. More can be dropped into the
+forms directory (ACC_FORMS_DIR, default ./forms) as JSON, one form per file,
+without restarting anything:
+
+    {
+        "name": "Remodel",
+        "label": "Remodel / Structure / Landscape",
+        "template": "ACC-Application-Remodels-2025.pdf",
+        "pages": [1, 2],
+        "instruction_pages": [0, 4],
+        "layout": "REMODEL_LAYOUT",
+        "ui": "Remodel"
+    }
+
+A file whose name matches a built-in form replaces it; any other name adds a
+form. "template" is resolved against the JSON file's directory. "layout" is
+either a list of [page, kind, x, y, key, when] entries or the name of a table
+in layouts.py; "ui" and "sidebar" are lists of UI items or the name of a
+form to borrow them from. "pages" may be given as "start_page" instead.
+
+The directory is re-scanned at most every RELOAD_INTERVAL seconds; a changed
+file replaces its form, and a file that fails to load keeps the last good
+version. Layouts are compiled, and templates read (pdf_engine.TemplateCache),
+only when a form is first used.
+
+Standard library only, so app.py can build its UI before the PDF engine loads.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import itertools
+import threading
+from collections.abc import Mapping
+from functools import cached_property
+
+import layouts
+from layouts import CHECK, TEXT, Field, PAINTING_LAYOUT, REMODEL_LAYOUT, ROOFING_LAYOUT, SOLAR_LAYOUT
+
+# Relative template names are resolved against this directory, not the CWD
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FORMS_DIR = os.environ.get("ACC_FORMS_DIR", os.path.join(BASE_DIR, "forms"))
+
+# How often, at most, lookups re-scan FORMS_DIR for changed definitions
+RELOAD_INTERVAL = 1.0
+
+log = logging.getLogger(__name__)
+
+# ==========================================
+# 1. LAYOUT COMPILER
+# ==========================================
+def compile_layout(layout):
+    """Groups a layout table into per-page draw lists, in table order"""
+    pages = [[] for _ in range(max(f.page for f in layout) + 1)]
+    for f in layout:
+        pages[f.page].append((f.kind == CHECK, f.x, f.y, f.key, f.when))
+    return tuple(tuple(fields) for fields in pages)
+
+def layout_keys(compiled):
+    """Every form_data key a compiled layout reads, including condition keys"""
+    keys = set()
+    for fields in compiled:
+        for _, _, _, key, when in fields:
+            keys.add(key)
+            if when:
+                keys.add(when[0])
+    return tuple(sorted(keys))
+
+def layout_branches(compiled):
+    """Every branch of a compiled layout, as the {key: value} its when=
+    conditions select on, in layout order.
+
+    The branches are every combination of the values the conditions test
+    (roof_action, samples_status); a layout without conditions has the one
+    branch {}.
+    """
+    switches = {}
+    for fields in compiled:
+        for *_, when in fields:
+            if when and when[1] not in switches.setdefault(when[0], []):
+                switches[when[0]].append(when[1])
+    return [dict(zip(switches, values)) for values in itertools.product(*switches.values())]
+
+def sample_records(compiled):
+    """One form_data per branch of a compiled layout, each with every field
+    that branch draws filled in"""
+    fields = [field for page in compiled for field in page]
+    records = []
+    for branch in layout_branches(compiled):
+        data = dict(branch)
+        for is_check, _, _, key, when in fields:
+            if key in data or (when and data.get(when[0]) != when[1]):
+                continue
+            data[key] = True if is_check else "Sample " + key.replace("_", " ")
+        records.append(data)
+    return records
+
+# ==========================================
+# 2. FORM SPECS
+# ==========================================
+class FormSpec:
+    """Everything that makes up one application form.
+
+    `pages` holds the template page index each overlay page is drawn on
+    (default: from start_page on). `sidebar` and `ui` are lists of UI items
+    (section 4) shown outside and inside the app's form. `digest` changes
+    whenever anything that affects the generated PDF does.
+    """
+    def __init__(self, name, label, template, layout, pages=None, start_page=1, instruction_pages=(),
+                 sidebar=(), ui=(), source=None):
+        self.name = name
+        self.label = label
+        self.template = template
+        self.layout = tuple(layout)
+        self._pages = tuple(pages) if pages is not None else None
+        self.start_page = start_page
+        self.instruction_pages = tuple(instruction_pages)
+        self.sidebar = tuple(sidebar)
+        self.ui = tuple(ui)
+        # The JSON file the spec came from, or None for a built-in form
+        self.source = source
+
+    @cached_property
+    def compiled(self):
+        return compile_layout(self.layout)
+
+    @cached_property
+    def pages(self):
+        if self._pages is not None:
+            return self._pages
+        return tuple(self.start_page + page_no for page_no in range(len(self.compiled)))
+
+    @cached_property
+    def keys(self):
+        return layout_keys(self.compiled)
+
+    @cached_property
+    def digest(self):
+        payload = json.dumps([self.template, self.pages, self.instruction_pages, self.layout])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def __repr__(self):
+        return f"FormSpec({self.name!r}, {self.template!r})"
+
+def _field(entry):
+    field = Field(**entry) if isinstance(entry, dict) else Field(*entry)
+    if field.kind not in (TEXT, CHECK) or field.page < 0:
+        raise ValueError(f"Bad layout entry {entry!r}")
+    return field._replace(when=tuple(field.when) if field.when else None)
+
+def load_spec(path, forms):
+    """A FormSpec from a JSON definition; `forms` supplies borrowed layouts and UI"""
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    name = raw.get("name") or os.path.splitext(os.path.basename(path))[0]
+    base = forms.get(name)
+
+    layout = raw.get("layout", base.layout if base else None)
+    if isinstance(layout, str):
+        layout = getattr(layouts, layout)
+    if not layout:
+        raise ValueError(f"{path}: no layout")
+
+    def borrowed(key):
+        value = raw.get(key)
+        if value is None:
+            return getattr(base, key) if base else ()
+        if isinstance(value, str):
+            return getattr(forms[value], key)
+        return value
+
+    template = raw.get("template", base.template if base else None)
+    if not template:
+        raise ValueError(f"{path}: no template")
+    if "template" in raw:
+        template = os.path.join(os.path.dirname(os.path.abspath(path)), template)
+    return FormSpec(name, raw.get("label", base.label if base else name), template,
+                    [_field(entry) for entry in layout], raw.get("pages"), raw.get("start_page", 1),
+                    raw.get("instruction_pages", base.instruction_pages if base else ()),
+                    borrowed("sidebar"), borrowed("ui"), source=path)
+
+# ==========================================
+# 3. REGISTRY
+# ==========================================
+class FormRegistry(Mapping):
+    """Form type -> FormSpec: the built-ins, overlaid by FORMS_DIR's JSON files.
+
+    Reads as a dict in registration order. `version` goes up each time the
+    set of forms changes, so caches keyed on it can drop what they built.
+    """
+    def __init__(self, forms_dir=None, reload_interval=RELOAD_INTERVAL):
+        self.forms_dir = forms_dir
+        self.reload_interval = reload_interval
+        self.version = 0
+        self._builtin = {}
+        self._files = {}  # path -> (mtime_ns, size, spec or None)
+        self._forms = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def register(self, spec):
+        with self._lock:
+            self._builtin[spec.name] = spec
+            self._rebuild()
+
+    def refresh(self, force=False):
+        """Picks up added, changed and removed JSON definitions"""
+        if not self.forms_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                names = sorted(name for name in os.listdir(self.forms_dir) if name.endswith(".json"))
+            except OSError:
+                names = []
+            files = {}
+            for name in names:
+                path = os.path.join(self.forms_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                known = self._files.get(path)
+                if known and known[:2] == (stat.st_mtime_ns, stat.st_size):
+                    files[path] = known
+                    continue
+                try:
+                    spec = load_spec(path, self._builtin)
+                except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                    # Keep serving the last version that loaded
+                    log.warning("Could not load form definition %s: %s", path, e)
+                    spec = known[2] if known else None
+                files[path] = (stat.st_mtime_ns, stat.st_size, spec)
+            if files != self._files:
+                self._files = files
+                self._rebuild()
+
+    def _rebuild(self):
+        forms = dict(self._builtin)
+        for _, _, spec in self._files.values():
+            if spec is not None:
+                forms[spec.name] = spec
+        self._forms = forms
+        self.version += 1
+
+    def __getitem__(self, name):
+        self.refresh()
+        return self._forms[name]
+
+    def __iter__(self):
+        self.refresh()
+        return iter(list(self._forms))
+
+    def __len__(self):
+        self.refresh()
+        return len(self._forms)
+
+    def by_label(self, label):
+        """The form the app lists under `label`"""
+        for spec in self.values():
+            if spec.label == label:
+                return spec
+        raise KeyError(label)
+
+# ==========================================
+# 4. UI SCHEMA
+# ==========================================
+# A form's UI is a list of items, each a dict with a "type":
+#   header / subheader / markdown / info   {"text"}
+#   text      {"key", "label", "widget_key"?}   a text input for form_data[key]
+#   select    {"key", "label", "options"}       starts unselected
+#   radio     {"key", "label", "options", "index"?}
+#   check     {"key", "label"}
+#   columns   {"columns": [[items], ...]}
+#   expander  {"label", "items", "expanded"?}
+#   uploads   {"label", "help"}                 supporting documents (attachments.py)
+# Any item may carry "when": [key, value] to show it only when form_data[key]
+# already equals value (sidebar choices are read first).
+def text(key, label, widget_key=None):
+    item = {"type": "text", "key": key, "label": label}
+    if widget_key:
+        item["widget_key"] = widget_key
+    return item
+
+def select(key, label, options):
+    return {"type": "select", "key": key, "label": label, "options": list(options)}
+
+def radio(key, label, options, index=None):
+    return {"type": "radio", "key": key, "label": label, "options": list(options), "index": index}
+
+def check(key, label):
+    return {"type": "check", "key": key, "label": label}
+
+def columns(*cols):
+    return {"type": "columns", "columns": [list(col) for col in cols]}
+
+def expander(label, items, expanded=False):
+    return {"type": "expander", "label": label, "items": list(items), "expanded": expanded}
+
+def note(kind, text_):
+    return {"type": kind, "text": text_}
+
+def when(condition, *items):
+    return [dict(item, when=list(condition)) for item in items]
+
+CONTRACTOR = [
+    columns([text("contractor_name", "Contractor Name")], [text("contractor_phone", "Contractor Phone")]),
+    text("contractor_address", "Contractor Address"),
+]
+
+MANUFACTURERS = ["Benjamin Moore", "Sherwin Williams", "Miller", "Other"]
+
+def _paint_row(title, prefix, select_label, key_prefix):
+    return [
+        note("markdown", f"**{title}**"),
+        columns([select(f"{prefix}_mfg", select_label, MANUFACTURERS)],
+                [text(f"{prefix}_id", "Color ID", f"{key_prefix}_id")],
+                [text(f"{prefix}_name", "Color Name", f"{key_prefix}_name")]),
+    ]
+
+PAINTING_UI = [
+    note("subheader", "3. Contractor Information"), *CONTRACTOR,
+    note("header", "🎨 Painting Details"),
+    *_paint_row("Siding", "siding", "Siding Manufacturer", "s"),
+    *_paint_row("Window Trim", "trim", "Trim Manufacturer", "t"),
+    *_paint_row("Brickwork Trim", "brickwork", "Brickwork Manufacturer", "b"),
+    *_paint_row("Shutters", "shutter", "Shutter Manufacturer", "sh"),
+    *_paint_row("Front Door", "door", "Front Door Manufacturer", "d"),
+    *_paint_row("Fence", "fence", "Fence", "f"),
+    note("markdown", "**Other Items**"),
+    columns([text("other_mfg", "Other Item Manufacturer")], [text("other_color_name", "Other Item Color Name")]),
+    note("subheader", "5. Samples"),
+    radio("samples_status", "Sample Status", ["Samples Placed", "Email ACC"]),
+    # Always shown inside the form; only printed when samples are placed
+    text("samples_location", "Where are the samples located? (e.g. Front Porch)"),
+]
+
+REMODEL_UI = [
+    note("subheader", "3. Contractor Information"), *CONTRACTOR,
+    note("header", "🔨 Project Details"),
+    expander("External Home Remodel", expanded=True, items=[columns(
+        [check("rem_room", "Room Additions"), check("rem_win", "Windows/Doors"), check("rem_mason", "Masonry")],
+        [check("rem_deck", "Deck or Patio"), check("rem_cover", "Patio Cover"),
+         check("rem_planter", "Attached Planter")],
+        [check("rem_drive", "Driveway Mod"), check("rem_retain", "Retaining Wall (Attached)")],
+    )]),
+    expander("Free-Standing Structures", [columns(
+        [check("str_fence", "New/Repl Fence"), check("str_bbq", "Outdoor Fireplace/BBQ"), check("str_ac", "AC Unit"),
+         check("str_gen", "Generator"), check("str_swing", "Swing Set")],
+        [check("str_pool", "Spa or Pool"), check("str_gazebo", "Gazebo"), check("str_trellis", "Arbor or Trellis"),
+         check("str_hoop", "Basketball Hoop"), check("str_gym", "Jungle Gym")],
+        [check("str_wall", "Masonry Wall"), check("str_green", "Greenhouse"), check("str_shed", "Garden Shed"),
+         check("str_play", "Playhouse"), check("str_tramp", "Trampoline")],
+    )]),
+    expander("Landscaping", [columns(
+        [check("lnd_grade", "Lawn/Garden Grade Change"), check("lnd_art", "Artificial Turf")],
+        [check("lnd_retain", "Retaining Wall (Landscape)"), check("lnd_tree_rem", "Protected Tree Removal")],
+        [check("lnd_shrub", "Trees/Shrubs <20' of Lake"), check("lnd_conserv", "Conservancy Plant Removal")],
+    )]),
+    {"type": "uploads", "label": "Drawings, photos and specifications",
+     "help": "Added after the application; up to {mb} MB in all"},
+]
+
+ROOFING_SIDEBAR = [
+    # Switches which fields are shown, so it lives outside the form where
+    # changing it reruns immediately
+    radio("roof_action", "Select Roofing Action", ["Replacement", "Cleaning", "Tinting"], index=0),
+]
+
+ROOFING_UI = [
+    note("header", "🏠 Roofing Details"),
+    *when(("roof_action", "Replacement"),
+          note("info", "Requirement: All replacement roofs shall utilize #1 sawn cedar shakes."),
+          note("subheader", "Contractor Information (Replacement)"),
+          text("contractor_name", "Contractor Name"), text("contractor_phone", "Contractor Phone"),
+          text("contractor_address", "Contractor Address")),
+    *when(("roof_action", "Cleaning"),
+          note("subheader", "Contractor Information (Cleaning)"),
+          text("contractor_name", "Contractor Name"), text("contractor_phone", "Contractor Phone"),
+          text("contractor_address", "Contractor Address"), text("roof_clean_product", "Product to be Used")),
+    *when(("roof_action", "Tinting"),
+          note("subheader", "Tinting Specs"),
+          text("roof_tint_mfg", "Manufacturer"), text("roof_tint_id", "Color ID Number"),
+          text("roof_tint_name", "Color Name")),
+]
+
+SOLAR_UI = [
+    note("header", "☀️ Solar Panel Details"),
+    note("subheader", "3. Contractor / Installer"), *CONTRACTOR,
+    note("subheader", "4. Required Documents"),
+    note("info", "Upload these here to add them to the application PDF, or attach them to your email:"),
+    note("markdown", "- **Drawings/Specifications**: Showing location, conduits, and compliance."),
+    note("markdown", "- **Aerial View**: Showing proposed panel on roof."),
+    note("markdown", "- **Manufacturer Specifications**: For the equipment."),
+    {"type": "uploads", "label": "Supporting documents",
+     "help": "Photos are scaled down to fit a page; up to {mb} MB in all"},
+]
+
+# ==========================================
+# 5. BUILT-IN FORMS
+# ==========================================
+# Instruction pages are the ones that only explain the process (instructions,
+# how to submit, the color DNA table); "form pages only" bundles leave them out
+FORMS = FormRegistry(FORMS_DIR)
+FORMS.register(FormSpec("Painting", "Exterior Painting", "ACC-Application-Painting-November-2023.pdf",
+                        PAINTING_LAYOUT, instruction_pages=(0, 5, 6), ui=PAINTING_UI))
+FORMS.register(FormSpec("Remodel", "Remodel / Structure / Landscape",
+                        "ACC-Application-Remodels-Strucures-Landscape-June-2024.pdf",
+                        REMODEL_LAYOUT, instruction_pages=(0, 4), ui=REMODEL_UI))
+FORMS.register(FormSpec("Roofing", "Roofing", "ACC-Application-Roofing-November-2023.pdf",
+                        ROOFING_LAYOUT, instruction_pages=(0,), sidebar=ROOFING_SIDEBAR, ui=ROOFING_UI))
+FORMS.register(FormSpec("Solar", "Solar Energy Panel", "ACC-Application-Solar-Energy-Panel-November-2023.pdf",
+                        SOLAR_LAYOUT, instruction_pages=(0,), ui=SOLAR_UI))
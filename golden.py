@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Golden-output regression check for the overlay layouts
+
+Generates every form and branch from fixture data (Roofing once per
+roof_action, Painting once per sample status, each empty, typical and full,
+as in bench.py), pulls the positioned text off each form page with pypdf's
+text visitor and compares it with the golden files in golden/: every stored
+string must be drawn within `tolerance` points of where it was, and nothing
+else may be. Cases run in parallel over a process pool.
+
+    python golden.py                  # check; exits 1 on any difference
+    python golden.py --update         # accept the current output as golden
+    python golden.py --forms Roofing --mode merge --tolerance 0.25
+
+Only text that is not already on the blank template page is compared, so the
+golden files hold just what the layout draws. Each golden file keeps its own
+form_data; --update reuses it and only makes up data for new cases.
+"""
+import os
+import re
+import io
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from pypdf import PdfReader
+
+import pdf_engine
+from bench import bench_cases
+from forms import BASE_DIR, FORMS
+
+GOLDEN_DIR = os.path.join(BASE_DIR, "golden")
+# Both draw the overlay at the same coordinates; the AcroForm modes draw
+# inside field appearance streams, which the text visitor doesn't place
+MODES = ("splice", "merge")
+# Points; anything under a pixel at 72 dpi is not a layout change
+TOLERANCE = 0.5
+
+# ==========================================
+# 1. EXTRACTION
+# ==========================================
+def page_text(page):
+    """(text, x, y) of every string the text visitor reports on a page, in page space"""
+    items = []
+
+    def visit(text, cm, tm, font_dict, font_size):
+        text = text.strip()
+        if text:
+            x, y = tm[4], tm[5]
+            items.append((text, round(x * cm[0] + y * cm[2] + cm[4], 2),
+                          round(x * cm[1] + y * cm[3] + cm[5], 2)))
+
+    page.extract_text(visitor_text=visit)
+    return items
+
+# (template hash, page index) -> Counter of what the blank page already shows
+_BLANK = {}
+
+def _blank_text(template, index):
+    key = (template.sha256, index)
+    blank = _BLANK.get(key)
+    if blank is None:
+        with template.lock:
+            items = page_text(template.reader.pages[index])
+        blank = _BLANK[key] = Counter((text, round(x), round(y)) for text, x, y in items)
+    return blank
+
+def overlay_text(pdf, form_type, templates=None):
+    """{template page index: sorted [text, x, y]} of what generation added to each form page"""
+    templates = templates or pdf_engine.TEMPLATES
+    spec = FORMS[form_type]
+    template = templates.get(spec.template)
+    reader = PdfReader(io.BytesIO(pdf))
+    pages = {}
+    for index in spec.pages:
+        if index >= len(reader.pages):
+            continue
+        blank = Counter(_blank_text(template, index))
+        added = []
+        for text, x, y in page_text(reader.pages[index]):
+            key = (text, round(x), round(y))
+            if blank[key]:
+                blank[key] -= 1
+            else:
+                added.append([text, x, y])
+        pages[str(index)] = sorted(added, key=lambda item: (-item[2], item[1], item[0]))
+    return pages
+
+# ==========================================
+# 2. CASES
+# ==========================================
+def golden_path(name, golden_dir=GOLDEN_DIR):
+    return os.path.join(golden_dir, name.replace("/", "__") + ".json")
+
+def init_worker():
+    """Parses every template once per worker process, not once per case"""
+    pdf_engine.warm_templates()
+
+def run_case(job):
+    """Generates one case; returns its overlay text or the error it raised"""
+    name, form_type, form_data, mode = job
+    started = time.perf_counter()
+    row = {"case": name, "form_type": form_type}
+    try:
+        pdf = pdf_engine.generate_pdf_bytes(dict(form_data), form_type, mode=mode)
+        row["pages"] = overlay_text(pdf, form_type)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = round(time.perf_counter() - started, 3)
+    return row
+
+def read_golden(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def write_golden(path, golden):
+    text = json.dumps(golden, indent=2, ensure_ascii=False)
+    # One [text, x, y] per line keeps the files short and their diffs readable
+    text = re.sub(r"\[\s+([^\[\]{}]*?)\s+\]", lambda m: "[" + re.sub(r",\n\s*", ", ", m.group(1)) + "]", text)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+
+# ==========================================
+# 3. COMPARISON
+# ==========================================
+def compare(expected, actual, tolerance=TOLERANCE):
+    """Differences between two {page: [[text, x, y]]}, as readable lines.
+
+    Each expected string is matched to the nearest unmatched string with the
+    same text; farther than `tolerance` on either axis counts as moved.
+    """
+    diffs = []
+    for page in sorted(set(expected) | set(actual), key=int):
+        remaining = [tuple(item) for item in actual.get(page, [])]
+        for text, x, y in expected.get(page, []):
+            same = [i for i, item in enumerate(remaining) if item[0] == text]
+            if not same:
+                diffs.append(f"page {page}: missing {text!r} at ({x}, {y})")
+                continue
+            best = min(same, key=lambda i: max(abs(remaining[i][1] - x), abs(remaining[i][2] - y)))
+            _, ax, ay = remaining.pop(best)
+            if max(abs(ax - x), abs(ay - y)) > tolerance:
+                diffs.append(f"page {page}: {text!r} moved ({x}, {y}) -> ({ax}, {ay})")
+        for text, x, y in remaining:
+            diffs.append(f"page {page}: unexpected {text!r} at ({x}, {y})")
+    return diffs
+
+# ==========================================
+# 4. DRIVER
+# ==========================================
+def run_checks(forms=None, mode="splice", tolerance=TOLERANCE, update=False, workers=None,
+               golden_dir=GOLDEN_DIR):
+    """Checks (or with update=True, rewrites) every case; returns one row per case"""
+    jobs, rows = [], []
+    for name, form_type, form_data in bench_cases():
+        if forms and form_type not in forms:
+            continue
+        path = golden_path(name, golden_dir)
+        if os.path.exists(path):
+            golden = read_golden(path)
+            jobs.append((name, golden["form_type"], golden["form_data"], mode))
+        elif update:
+            jobs.append((name, form_type, form_data, mode))
+        else:
+            rows.append({"case": name, "form_type": form_type, "diffs": [f"no golden file {path}"]})
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        results = list(pool.map(run_case, jobs))
+
+    if update:
+        os.makedirs(golden_dir, exist_ok=True)
+    for (name, form_type, form_data, _), result in zip(jobs, results):
+        if "error" in result:
+            rows.append(dict(result, diffs=[result["error"]]))
+            continue
+        path = golden_path(name, golden_dir)
+        if update:
+            write_golden(path, {"case": name, "form_type": form_type, "form_data": form_data,
+                                "pages": result["pages"]})
+            rows.append(dict(result, diffs=[]))
+        else:
+            rows.append(dict(result, diffs=compare(read_golden(path)["pages"], result["pages"], tolerance)))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check overlay text positions against golden files")
+    parser.add_argument("--forms", nargs="+", choices=sorted(FORMS), default=None)
+    parser.add_argument("--mode", default="splice", choices=MODES)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="points either way")
+    parser.add_argument("--update", action="store_true", help="rewrite the golden files from the current output")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="default: CPU count")
+    parser.add_argument("--golden-dir", default=GOLDEN_DIR)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    rows = run_checks(args.forms, args.mode, args.tolerance, args.update, args.workers, args.golden_dir)
+    elapsed = time.perf_counter() - started
+
+    failed = [row for row in rows if row["diffs"]]
+    for row in rows:
+        strings = sum(len(items) for items in row.get("pages", {}).values())
+        status = "FAIL" if row["diffs"] else ("wrote" if args.update else "ok")
+        print(f"{status:<6}{row['case']:<30}{strings:>4} strings")
+        for diff in row["diffs"]:
+            print(f"      {diff}")
+    print(f"\n{len(rows)} cases, {len(failed)} failed in {elapsed:.2f}s ({args.mode}, tolerance {args.tolerance:g} pt)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
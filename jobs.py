@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background generation jobs for the Lakes HOA ACC applications
+
+The app hands each "Generate Application PDF" to a JobQueue instead of
+building the PDF in the session's script thread. A fixed number of worker
+threads take jobs earliest-due first; the session polls its job and picks up
+the PDF once it is done, so a burst of submissions waits in the queue rather
+than tying up every session.
+
+A job that raises is retried with exponential backoff (with jitter) up to
+max_attempts times, unless the error says the input itself is wrong
+(PERMANENT_ERRORS), which no retry will fix. stats() reports queue depth,
+the time jobs waited for a worker and the time they ran.
+
+A finished job is held until its session collects it, then forgotten, so
+each PDF is kept once, by the session. Jobs nobody collects are dropped
+after keep_seconds, or sooner, oldest first, once their results pass
+max_result_bytes.
+
+Jobs live in memory by default. With a SqliteStore each job and every change
+to it is also written to a SQLite file, so jobs that were queued or running
+are picked up again after a restart, and the queue can be inspected from
+another process. A store error is logged rather than raised: a job that
+can't be marked running counts a failed attempt, and one that has finished
+stays settled in memory. The store keeps a job's payload only until it
+finishes and never holds results:
+
+    python jobs.py acc_jobs.db stats
+    python jobs.py acc_jobs.db list --status failed
+
+Standard library only; handlers import what they need when they run.
+"""
+import sys
+import json
+import time
+import logging
+import uuid
+import shutil
+import heapq
+import base64
+import random
+import sqlite3
+import argparse
+import itertools
+import threading
+from collections import OrderedDict, deque
+from datetime import date
+
+log = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Errors that come from the input rather than the moment; retrying won't help
+PERMANENT_ERRORS = (ValueError, KeyError, TypeError)
+
+class QueueFull(Exception):
+    """More jobs are waiting than the queue accepts; try again shortly"""
+
+# ==========================================
+# 1. JOBS
+# ==========================================
+class Job:
+    """One unit of work and how far it has got. Times are time.time() seconds."""
+    __slots__ = ("id", "kind", "payload", "status", "attempts", "max_attempts", "created", "started",
+                 "finished", "run_after", "error", "error_type", "result")
+
+    def __init__(self, kind, payload, max_attempts, job_id=None, created=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.status = QUEUED
+        self.attempts = 0
+        self.max_attempts = max_attempts
+        self.created = created or time.time()
+        self.started = None
+        self.finished = None
+        self.run_after = self.created
+        self.error = None
+        self.error_type = None
+        self.result = None
+
+    def as_dict(self):
+        """Everything but the payload and result, for status checks"""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "run_after": self.run_after,
+            "error": self.error,
+            "error_type": self.error_type,
+            "bytes": len(self.result) if self.result is not None else None,
+        }
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+    return {"p50": pick(0.5), "p95": pick(0.95), "max": round(values[-1] * 1000, 1)}
+
+# ==========================================
+# 2. SQLITE STORE
+# ==========================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    max_attempts INTEGER NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    run_after REAL NOT NULL,
+    error TEXT,
+    error_type TEXT,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, run_after);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs(finished);
+"""
+
+COLUMNS = ("id", "kind", "status", "attempts", "max_attempts", "created", "started", "finished",
+           "run_after", "error", "error_type")
+
+def _encode(value):
+    # Payloads carry uploaded files as bytes and form dates as dates
+    if isinstance(value, (bytes, bytearray)):
+        return {"$bytes": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Can't store {type(value).__name__} in a job payload")
+
+def _decode(obj):
+    if len(obj) == 1 and "$bytes" in obj:
+        return base64.b64decode(obj["$bytes"])
+    return obj
+
+class SqliteStore:
+    """Jobs kept in SQLite, so a restart resumes them; safe to share between threads.
+
+    Dates in a payload come back as ISO strings, which is how the PDF prints
+    them anyway.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add(self, job):
+        payload = json.dumps(job.payload, default=_encode)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(COLUMNS)}, payload) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                [getattr(job, column) for column in COLUMNS] + [payload])
+
+    def update(self, job):
+        """Writes the job's state; a finished job also drops its payload"""
+        columns = [column for column in COLUMNS if column != "id"]
+        sql = f"UPDATE jobs SET {', '.join(column + ' = ?' for column in columns)}"
+        params = [getattr(job, column) for column in columns]
+        if job.status in (DONE, FAILED):
+            sql += ", payload = NULL"
+        with self._lock, self._conn:
+            self._conn.execute(sql + " WHERE id = ?", params + [job.id])
+
+    def _job(self, row, payload=None):
+        job = Job(row["kind"], payload, row["max_attempts"], row["id"], row["created"])
+        for column in COLUMNS[2:]:
+            setattr(job, column, row[column])
+        return job
+
+    def pending(self):
+        """Jobs that never finished, due first; ones that were running start over as queued"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)}, payload FROM jobs WHERE status IN (?, ?) ORDER BY run_after",
+                (QUEUED, RUNNING)).fetchall()
+        jobs = []
+        for row in rows:
+            job = self._job(row, json.loads(row["payload"], object_hook=_decode))
+            job.status = QUEUED
+            jobs.append(job)
+        return jobs
+
+    def find(self, status=None, limit=50):
+        clause, params = (" WHERE status = ?", [status]) if status else ("", [])
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs{clause} ORDER BY created DESC LIMIT ?",
+                                      params + [limit]).fetchall()
+        return [self._job(row).as_dict() for row in rows]
+
+    def prune(self, before):
+        """Drops jobs that finished before `before`"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE finished < ?", (before,))
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._conn.execute("SELECT MIN(created) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        return {"counts": counts, "oldest_queued_s": round(time.time() - oldest, 1) if oldest else None}
+
+# ==========================================
+# 3. QUEUE
+# ==========================================
+class JobQueue:
+    """Runs jobs on `workers` threads, earliest-due first.
+
+    handlers maps a job kind to a function of the job's payload; what it
+    returns is the job's result. At most max_queued jobs may wait, retries
+    included; submit raises QueueFull past that. A finished job stays until
+    collect() hands it over, for at most keep_seconds and while the results
+    held add up to no more than max_result_bytes.
+    """
+    def __init__(self, handlers, workers=2, max_queued=64, max_attempts=3, backoff=1.0, max_backoff=30.0,
+                 keep_seconds=600, max_result_bytes=64 * 1024 * 1024, store=None, window=500):
+        self.handlers = dict(handlers)
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.keep_seconds = keep_seconds
+        self.max_result_bytes = max_result_bytes
+        self.store = store
+        self._jobs = {}
+        self._finished = OrderedDict()  # job id -> result size, oldest first
+        self._ready = []  # heap of (run_after, seq, job id)
+        self._reserved = 0  # slots taken by submits still writing to the store
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._waits = deque(maxlen=window)
+        self._runs = deque(maxlen=window)
+        self._closed = False
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.rejected = 0
+        self.expired = 0
+        self.result_bytes = 0
+
+        if store is not None:
+            for job in store.pending():
+                self._jobs[job.id] = job
+                heapq.heappush(self._ready, (job.run_after, next(self._seq), job.id))
+        self._threads = [threading.Thread(target=self._work, name=f"job-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, kind, payload):
+        """Queues a job; returns its id"""
+        if kind not in self.handlers:
+            raise ValueError(f"No handler for job kind {kind!r}")
+        job = Job(kind, payload, self.max_attempts)
+        # The slot is taken before the store write, which happens outside the
+        # lock, so concurrent submits can't push the queue past max_queued
+        with self._cond:
+            if len(self._ready) + self._reserved >= self.max_queued:
+                self.rejected += 1
+                raise QueueFull()
+            self._reserved += 1
+        try:
+            # Stored before a worker can see it, so its updates always find the row
+            if self.store is not None:
+                self.store.add(job)
+        except BaseException:
+            with self._cond:
+                self._reserved -= 1
+            raise
+        with self._cond:
+            self._reserved -= 1
+            self._jobs[job.id] = job
+            heapq.heappush(self._ready, (job.run_after, next(self._seq), job.id))
+            self._cond.notify_all()
+        return job.id
+
+    def get(self, job_id):
+        """The Job (status, attempts, error, result), or None if unknown, collected or expired"""
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def collect(self, job_id):
+        """Hands over a finished Job and forgets it, so its result is held only
+        by the caller; None if the job hasn't finished (or is unknown)"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in (DONE, FAILED):
+                return None
+            self._forget(job_id)
+        return job
+
+    def wait(self, job_id, timeout=None):
+        """Blocks until the job has finished or `timeout` passes; returns the Job"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._jobs.get(job_id) is None
+                                or self._jobs[job_id].status in (DONE, FAILED), timeout)
+        return self.get(job_id)
+
+    def position(self, job_id):
+        """How many waiting jobs are due before this one (0 when it is next or running)"""
+        with self._cond:
+            mine = next((entry for entry in self._ready if entry[2] == job_id), None)
+            if mine is None:
+                return 0
+            return sum(1 for entry in self._ready if entry < mine)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    now = time.time()
+                    if self._ready and self._ready[0][0] <= now:
+                        _, _, job_id = heapq.heappop(self._ready)
+                        break
+                    self._cond.wait(self._ready[0][0] - now if self._ready else None)
+                job = self._jobs[job_id]
+                job.status = RUNNING
+                job.attempts += 1
+                job.started = time.time()
+                self.running += 1
+                if job.attempts == 1:
+                    self._waits.append(job.started - job.created)
+            try:
+                if self.store is not None:
+                    self.store.update(job)
+            except Exception as e:
+                # Not run, but counted as an attempt, so a store that keeps
+                # failing ends the job as FAILED instead of retrying forever
+                log.exception("Could not mark job %s running in the store", job.id)
+                result, error, elapsed = None, e, None
+            else:
+                started = time.perf_counter()
+                try:
+                    result, error = self.handlers[job.kind](job.payload), None
+                except Exception as e:
+                    result, error = None, e
+                elapsed = time.perf_counter() - started
+
+            with self._cond:
+                self.running -= 1
+                if elapsed is not None:
+                    self._runs.append(elapsed)
+                now = time.time()
+                if error is None:
+                    job.status, job.result, job.finished = DONE, result, now
+                    job.error = job.error_type = None
+                    job.payload = None
+                    self.completed += 1
+                    self._finished[job.id] = len(result) if result is not None else 0
+                    self.result_bytes += self._finished[job.id]
+                else:
+                    job.error, job.error_type = str(error), type(error).__name__
+                    if job.attempts < job.max_attempts and not isinstance(error, PERMANENT_ERRORS):
+                        delay = min(self.max_backoff, self.backoff * 2 ** (job.attempts - 1))
+                        job.status, job.run_after = QUEUED, now + delay * (0.5 + random.random() / 2)
+                        heapq.heappush(self._ready, (job.run_after, next(self._seq), job.id))
+                        self.retries += 1
+                    else:
+                        job.status, job.finished = FAILED, now
+                        job.payload = None
+                        self.failed += 1
+                        self._finished[job.id] = 0
+                expired = self._expire(now)
+                self._cond.notify_all()
+            if self.store is not None:
+                # The job is settled in memory either way; a store error only
+                # leaves the file behind, and must not take the worker with it
+                try:
+                    self.store.update(job)
+                    if expired:
+                        self.store.prune(now - self.keep_seconds)
+                except Exception:
+                    log.exception("Could not save job %s to the store", job.id)
+
+    def _forget(self, job_id):
+        del self._jobs[job_id]
+        self.result_bytes -= self._finished.pop(job_id)
+
+    def _expire(self, now):
+        """Forgets uncollected jobs, oldest first, that finished more than
+        keep_seconds ago or don't fit in max_result_bytes; returns how many"""
+        cutoff = now - self.keep_seconds
+        expired = 0
+        while self._finished:
+            job_id = next(iter(self._finished))
+            if self.result_bytes <= self.max_result_bytes and self._jobs[job_id].finished >= cutoff:
+                break
+            self._forget(job_id)
+            expired += 1
+        self.expired += expired
+        return expired
+
+    def stats(self):
+        with self._cond:
+            now = time.time()
+            waiting = [self._jobs[job_id] for _, _, job_id in self._ready]
+            return {
+                "workers": self.workers,
+                "queued": sum(1 for job in waiting if not job.attempts),
+                "retrying": sum(1 for job in waiting if job.attempts),
+                "running": self.running,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "uncollected": len(self._finished),
+                "result_bytes": self.result_bytes,
+                "oldest_wait_s": round(now - min(job.created for job in waiting), 2) if waiting else 0,
+                "wait_ms": _percentiles(self._waits),
+                "run_ms": _percentiles(self._runs),
+            }
+
+    def shutdown(self, wait=True):
+        """Stops the workers once their current jobs finish; queued jobs stay in the store"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+# ==========================================
+# 4. GENERATION
+# ==========================================
+def application_handler(templates=None, cache=None, archive=None, max_attachment_bytes=None):
+    """A handler for "application" jobs, whose payload is
+    {"form_type", "form_data", "optimize", "attachments": [file path], "upload_dir"}.
+
+    upload_dir is the folder the attachments were spooled into; it is removed
+    once no retry can need them, when the job succeeds or fails on its input.
+    """
+    def generate(payload):
+        from pdf_engine import MAX_ATTACHMENT_BYTES, generate_pdf_bytes
+        retry = False
+        try:
+            # The archive records the PDF with its attachments, as it was served
+            return generate_pdf_bytes(payload["form_data"], payload["form_type"], templates=templates, cache=cache,
+                                      optimize=payload.get("optimize", False), archive=archive,
+                                      attachments=payload.get("attachments") or [],
+                                      max_attachment_bytes=max_attachment_bytes or MAX_ATTACHMENT_BYTES)
+        except Exception as e:
+            retry = not isinstance(e, PERMANENT_ERRORS)
+            raise
+        finally:
+            if payload.get("upload_dir") and not retry:
+                shutil.rmtree(payload["upload_dir"], ignore_errors=True)
+    return generate
+
+def bundle_handler(templates=None, archive=None):
+    """A handler for "bundle" jobs (household bundles), whose payload is
+    {"forms": [[form_type, form_data]], "optimize", "form_pages_only"}"""
+    def generate(payload):
+        from pdf_engine import generate_bundle_bytes
+        return generate_bundle_bytes([(form_type, form_data) for form_type, form_data in payload["forms"]],
+                                     templates=templates, optimize=payload.get("optimize", False),
+                                     form_pages_only=payload.get("form_pages_only", False), archive=archive)
+    return generate
+
+# ==========================================
+# 5. CLI
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect a SQLite job store")
+    parser.add_argument("path", help="job database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="jobs per status and the oldest waiting")
+    find = commands.add_parser("list", help="recent jobs, newest first")
+    find.add_argument("--status", choices=[QUEUED, RUNNING, DONE, FAILED])
+    find.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    store = SqliteStore(args.path)
+    if args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+        return 0
+    for job in store.find(args.status, args.limit):
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["created"]))
+        print(f"{job['id']}  {created}  {job['status']:<8} attempt {job['attempts']}/{job['max_attempts']}"
+              f"  {job['error_type'] + ': ' + job['error'] if job['error'] else ''}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Field layouts for the Lakes HOA ACC applications
+
+One table per form. Each Field places a form_data key on an overlay page:
+page 0 lands on the form page of the template (PDF page 2), page 1 on the page
+after it. TEXT draws the value, CHECK draws an X when the value is truthy.
+A field with `when=(key, value)` is only drawn when form_data[key] == value,
+which is how the Roofing contractor boxes and Painting samples are switched.
+"""
+from collections import namedtuple
+
+TEXT = "text"
+CHECK = "check"
+
+Field = namedtuple("Field", ["page", "kind", "x", "y", "key", "when"], defaults=[None])
+
+# ==========================================
+# PAINTING
+# ==========================================
+PAINTING_LAYOUT = [
+    # --- PAGE 1 (Matches PDF Page 2) ---
+    Field(0, TEXT, 170, 670, "date_prepared"),
+    Field(0, TEXT, 170, 653, "owner_name"),
+    Field(0, TEXT, 425, 653, "lot_number"),
+    Field(0, TEXT, 170, 635, "address"),
+    Field(0, TEXT, 170, 607, "designated_contact"),
+
+    Field(0, TEXT, 170, 578, "home_phone"),
+    Field(0, TEXT, 425, 578, "work_phone"),
+    Field(0, TEXT, 170, 565, "mobile_phone"),
+    Field(0, TEXT, 425, 565, "email"),
+
+    Field(0, TEXT, 170, 550, "start_date"),
+    Field(0, TEXT, 425, 550, "end_date"),
+
+    Field(0, TEXT, 150, 295, "contractor_name"),
+    Field(0, TEXT, 150, 280, "contractor_address"),
+    Field(0, TEXT, 150, 268, "contractor_phone"),
+
+    # Paint Table
+    Field(0, TEXT, 160, 178, "siding_mfg"), Field(0, TEXT, 250, 178, "siding_id"), Field(0, TEXT, 400, 178, "siding_name"),
+    Field(0, TEXT, 160, 164, "brickwork_mfg"), Field(0, TEXT, 250, 164, "brickwork_id"), Field(0, TEXT, 400, 164, "brickwork_name"),
+    Field(0, TEXT, 160, 152, "trim_mfg"), Field(0, TEXT, 250, 152, "trim_id"), Field(0, TEXT, 400, 152, "trim_name"),
+    Field(0, TEXT, 160, 137, "shutter_mfg"), Field(0, TEXT, 250, 137, "shutter_id"), Field(0, TEXT, 400, 137, "shutter_name"),
+    Field(0, TEXT, 160, 125, "door_mfg"), Field(0, TEXT, 250, 125, "door_id"), Field(0, TEXT, 400, 125, "door_name"),
+    Field(0, TEXT, 160, 110, "fence_mfg"), Field(0, TEXT, 250, 110, "fence_id"), Field(0, TEXT, 400, 110, "fence_name"),
+    Field(0, TEXT, 160, 98, "other_mfg"), Field(0, TEXT, 400, 98, "other_color_name"),
+
+    # --- PAGE 2 (Samples) ---
+    Field(1, CHECK, 45, 645, "samples_status", when=("samples_status", "Samples Placed")),
+    Field(1, TEXT, 60, 630, "samples_location", when=("samples_status", "Samples Placed")),
+    Field(1, CHECK, 45, 612, "samples_status", when=("samples_status", "Email ACC")),
+]
+
+# ==========================================
+# REMODEL / STRUCTURE / LANDSCAPE
+# ==========================================
+REMODEL_LAYOUT = [
+    # --- PAGE 1 OF OVERLAY ---
+    Field(0, TEXT, 170, 625, "date_prepared"),
+    Field(0, TEXT, 170, 610, "owner_name"),
+    Field(0, TEXT, 425, 610, "lot_number"),
+    Field(0, TEXT, 170, 587, "address"),
+    Field(0, TEXT, 170, 555, "designated_contact"),
+
+    Field(0, TEXT, 170, 534, "home_phone"),
+    Field(0, TEXT, 425, 534, "work_phone"),
+    Field(0, TEXT, 170, 520, "mobile_phone"),
+    Field(0, TEXT, 425, 520, "email"),
+
+    Field(0, TEXT, 170, 505, "start_date"),
+    Field(0, TEXT, 425, 505, "end_date"),
+
+    Field(0, TEXT, 150, 330, "contractor_name"),
+    Field(0, TEXT, 150, 317, "contractor_address"),
+    Field(0, TEXT, 150, 304, "contractor_phone"),
+
+    # Remodel Checkboxes
+    Field(0, CHECK, 170, 225, "rem_room"), Field(0, CHECK, 170, 215, "rem_win"), Field(0, CHECK, 170, 202, "rem_mason"),
+    Field(0, CHECK, 290, 225, "rem_deck"), Field(0, CHECK, 290, 215, "rem_cover"), Field(0, CHECK, 290, 202, "rem_planter"),
+    Field(0, CHECK, 445, 225, "rem_drive"), Field(0, CHECK, 445, 215, "rem_retain"),
+
+    # --- PAGE 2 OF OVERLAY ---
+    # Structures
+    Field(1, CHECK, 185, 695, "str_fence"), Field(1, CHECK, 185, 675, "str_bbq"), Field(1, CHECK, 185, 660, "str_ac"),
+    Field(1, CHECK, 185, 645, "str_gen"), Field(1, CHECK, 185, 630, "str_swing"),
+    Field(1, CHECK, 300, 695, "str_pool"), Field(1, CHECK, 300, 675, "str_gazebo"), Field(1, CHECK, 300, 660, "str_trellis"),
+    Field(1, CHECK, 300, 645, "str_hoop"), Field(1, CHECK, 300, 630, "str_gym"),
+    Field(1, CHECK, 425, 695, "str_wall"), Field(1, CHECK, 425, 675, "str_green"), Field(1, CHECK, 425, 660, "str_shed"),
+    Field(1, CHECK, 425, 645, "str_play"), Field(1, CHECK, 425, 630, "str_tramp"),
+
+    # Landscape
+    Field(1, CHECK, 180, 505, "lnd_grade"), Field(1, CHECK, 180, 485, "lnd_art"),
+    Field(1, CHECK, 330, 505, "lnd_retain"), Field(1, CHECK, 330, 485, "lnd_tree_rem"),
+    Field(1, CHECK, 495, 505, "lnd_shrub"), Field(1, CHECK, 495, 485, "lnd_conserv"),
+]
+
+# ==========================================
+# ROOFING
+# ==========================================
+REPLACEMENT = ("roof_action", "Replacement")
+CLEANING = ("roof_action", "Cleaning")
+TINTING = ("roof_action", "Tinting")
+
+ROOFING_LAYOUT = [
+    # --- PAGE 1 OF OVERLAY (Matches PDF Page 2) ---
+    Field(0, TEXT, 190, 678, "owner_name"),
+    Field(0, TEXT, 440, 650, "lot_number"),
+    Field(0, TEXT, 190, 662, "address"),
+    Field(0, TEXT, 190, 650, "date_prepared"),
+
+    Field(0, TEXT, 190, 635, "home_phone"),
+    Field(0, TEXT, 440, 635, "work_phone"),
+    Field(0, TEXT, 190, 620, "mobile_phone"),
+    Field(0, TEXT, 440, 620, "email"),
+
+    Field(0, TEXT, 190, 605, "start_date"),
+    Field(0, TEXT, 440, 605, "end_date"),
+
+    # General/Replacement Contractor (Top Box)
+    Field(0, TEXT, 200, 540, "contractor_name", when=REPLACEMENT),
+    Field(0, TEXT, 200, 525, "contractor_address", when=REPLACEMENT),
+    Field(0, TEXT, 200, 515, "contractor_phone", when=REPLACEMENT),
+
+    # Cleaning Contractor (Middle Box)
+    Field(0, TEXT, 200, 465, "contractor_name", when=CLEANING),
+    Field(0, TEXT, 200, 450, "contractor_address", when=CLEANING),
+    Field(0, TEXT, 200, 438, "contractor_phone", when=CLEANING),
+    Field(0, TEXT, 200, 425, "roof_clean_product", when=CLEANING),
+
+    # Tinting (Bottom Box)
+    Field(0, TEXT, 60, 360, "roof_tint_mfg", when=TINTING),
+    Field(0, TEXT, 150, 360, "roof_tint_id", when=TINTING),
+    Field(0, TEXT, 290, 360, "roof_tint_name", when=TINTING),
+]
+
+# ==========================================
+# SOLAR
+# ==========================================
+SOLAR_LAYOUT = [
+    # --- PAGE 1 OF OVERLAY (Matches Solar PDF Page 2) ---
+    # VERIFIED USER COORDINATES
+    Field(0, TEXT, 190, 620, "owner_name"),
+    Field(0, TEXT, 420, 588, "lot_number"),
+    Field(0, TEXT, 190, 604, "address"),
+    Field(0, TEXT, 190, 588, "date_prepared"),
+
+    Field(0, TEXT, 190, 575, "home_phone"),
+    Field(0, TEXT, 420, 575, "work_phone"),
+    Field(0, TEXT, 190, 560, "mobile_phone"),
+    Field(0, TEXT, 420, 560, "email"),
+
+    Field(0, TEXT, 190, 540, "start_date"),
+    Field(0, TEXT, 420, 540, "end_date"),
+
+    # Contractor Section (Solar)
+    Field(0, TEXT, 190, 490, "contractor_name"),
+    Field(0, TEXT, 190, 477, "contractor_address"),
+    Field(0, TEXT, 190, 460, "contractor_phone"),
+]
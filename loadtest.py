@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test for the Lakes HOA ACC Streamlit app
+
+Starts `streamlit run app.py` on a free local port and drives it the way
+browsers do: each simulated resident opens a websocket session, picks an
+application type (and roof action), fills in the form with made-up details,
+clicks "Generate Application PDF" and downloads the result. Sessions run
+concurrently at each level given, cycling through every form, and each level
+reports:
+
+    load       opening the page, up to the first script_finished
+    navigate   reruns from choosing the application type / roof action
+    submit     the "Generate Application PDF" rerun, plus the progress polls
+               that follow it while the PDF waits in the job queue, i.e. what
+               a resident waits on
+    download   fetching the PDF the download button points at
+
+as p50/p95/p99 latency, plus sessions per second, errors, and the server
+process's CPU time and resident memory (from /proc). Everything runs on
+localhost, so it can gate a deploy:
+
+    python loadtest.py --levels 1 2 4 8 -o baseline_load.json
+    python loadtest.py --levels 1 2 4 8 --baseline baseline_load.json --max-p95 1500
+
+AppTest runs a script in-process and cannot run sessions concurrently, so
+this talks to a real server over the same websocket protocol the frontend
+uses. The client shares the machine with the server; its own CPU time is
+reported alongside so a saturated client is easy to spot.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import platform
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from datetime import datetime, timezone
+
+import websockets
+import streamlit
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.Alert_pb2 import Alert
+
+from bench import FIRST, LAST, STREETS, COLORS, MAKERS, percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PHASES = ("load", "navigate", "submit", "download")
+SUBMIT_LABEL = "Generate Application PDF"
+
+# (name, sidebar choices by label, form choices by label); every form, Roofing
+# once per action and Painting once per sample status, as in bench.py
+SCENARIOS = (
+    ("Painting-Samples", {"Select Application Type": "Exterior Painting"}, {"Sample Status": "Samples Placed"}),
+    ("Painting-Email", {"Select Application Type": "Exterior Painting"}, {"Sample Status": "Email ACC"}),
+    ("Remodel", {"Select Application Type": "Remodel / Structure / Landscape"}, {}),
+    ("Roofing-Replacement", {"Select Application Type": "Roofing", "Select Roofing Action": "Replacement"}, {}),
+    ("Roofing-Cleaning", {"Select Application Type": "Roofing", "Select Roofing Action": "Cleaning"}, {}),
+    ("Roofing-Tinting", {"Select Application Type": "Roofing", "Select Roofing Action": "Tinting"}, {}),
+    ("Solar", {"Select Application Type": "Solar Energy Panel"}, {}),
+)
+
+# ==========================================
+# 1. SERVER
+# ==========================================
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class Server:
+    """`streamlit run app.py` in a subprocess, with its CPU and memory readable from /proc"""
+    def __init__(self, archive_path, log_path, port=None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, ACC_ARCHIVE=archive_path)
+        env.pop("ACC_METRICS_LOG", None)
+        self._log = open(log_path, "w", encoding="utf-8")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", os.path.join(HERE, "app.py"),
+             "--server.headless", "true", "--server.address", "127.0.0.1",
+             "--server.port", str(self.port), "--server.enableXsrfProtection", "false",
+             "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+            cwd=HERE, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"streamlit exited with {self.process.returncode}; see {self._log.name}")
+            try:
+                with urllib.request.urlopen(self.url + "/_stcore/health", timeout=2) as r:
+                    if r.status == 200:
+                        return
+            except OSError:
+                time.sleep(0.25)
+        raise RuntimeError(f"streamlit did not become healthy in {timeout}s; see {self._log.name}")
+
+    def cpu_seconds(self):
+        """User + system CPU time of the server process so far, or None off Linux"""
+        try:
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss_bytes(self):
+        """Resident set size of the server process, or None off Linux"""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._log.close()
+
+# ==========================================
+# 2. SESSIONS
+# ==========================================
+class SessionError(Exception):
+    pass
+
+class Session:
+    """One browser tab: a websocket session plus the widget states it would send.
+
+    Widgets are found by label in the deltas of each run, so the harness keeps
+    working when the layout moves; ids are what the server derives from each
+    widget's parameters, so they are the same in every session.
+    """
+    def __init__(self, ws, timeout=120):
+        self.ws = ws
+        self.timeout = timeout
+        self.widgets = {}
+        self.states = {}
+        self.alerts = []
+        self.download_url = None
+        self.auto_rerun = None
+
+    async def run(self, trigger=None, fragment_id=None):
+        """Sends a rerun with the current widget states and waits for it to finish.
+
+        With fragment_id this is the timed rerun of a run_every fragment, as
+        the frontend sends it; if the fragment reruns the whole page, this
+        waits for that run too.
+        """
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        if fragment_id:
+            msg.rerun_script.fragment_id = fragment_id
+            msg.rerun_script.is_auto_rerun = True
+        for widget_id, (field, value) in self.states.items():
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id = widget_id
+            setattr(state, field, value)
+        if trigger:
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id = trigger
+            state.trigger_value = True
+        await self.ws.send(msg.SerializeToString())
+
+        if not fragment_id:
+            self._reset()
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await asyncio.wait_for(self.ws.recv(), self.timeout))
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                self._element(fwd.delta.new_element)
+            elif kind == "auto_rerun":
+                self.auto_rerun = (fwd.auto_rerun.interval, fwd.auto_rerun.fragment_id)
+            elif kind == "script_finished":
+                if fwd.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    # st.rerun(); the full run that follows replaces this one
+                    self._reset()
+                    continue
+                if fwd.script_finished not in (ForwardMsg.FINISHED_SUCCESSFULLY,
+                                               ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY):
+                    raise SessionError(f"script finished with status {fwd.script_finished}")
+                return
+
+    def _reset(self):
+        # A full run redraws the page and drops the fragments' timers
+        self.widgets, self.alerts, self.download_url, self.auto_rerun = {}, [], None, None
+
+    def _element(self, element):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            raise SessionError(f"{element.exception.type}: {element.exception.message}")
+        if kind == "alert":
+            self.alerts.append((element.alert.format, element.alert.body))
+        elif kind == "download_button":
+            self.download_url = element.download_button.url
+        elif kind in ("selectbox", "radio", "text_input", "checkbox", "date_input", "button"):
+            widget = getattr(element, kind)
+            self.widgets.setdefault(widget.label, []).append((kind, widget))
+
+    def choose(self, label, option):
+        """Sets a selectbox or radio to one of its options; False if it isn't shown"""
+        for kind, widget in self.widgets.get(label, ()):
+            if option not in widget.options:
+                raise SessionError(f"{label!r} has no option {option!r}")
+            self.states[widget.id] = ("string_value", option)
+            return True
+        return False
+
+def _text(label, rng):
+    """A plausible value for a text input, by its label"""
+    lowered = label.lower()
+    if lowered in ("name", "designated contact (if different)", "contractor name"):
+        return f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+    if "lot" in lowered:
+        return str(rng.randint(1, 480))
+    if "address" in lowered:
+        return f"{rng.randint(100, 9999)} {rng.choice(STREETS)}"
+    if "phone" in lowered:
+        return f"({rng.randint(200, 989)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}"
+    if lowered == "email":
+        return f"{rng.choice(FIRST).lower()}.{rng.randint(1, 99)}@example.com"
+    if "manufacturer" in lowered:
+        return rng.choice(MAKERS)
+    if "id" in lowered.split():
+        return f"SW {rng.randint(6000, 9999)}"
+    return rng.choice(COLORS)
+
+def fill_form(session, form_choices, rng):
+    """Widget states for every field of the form, as a resident would leave them"""
+    for label, entries in session.widgets.items():
+        for kind, widget in entries:
+            if not widget.form_id:
+                continue
+            if kind == "text_input":
+                session.states[widget.id] = ("string_value", _text(label, rng))
+            elif kind in ("selectbox", "radio"):
+                option = form_choices.get(label) or rng.choice(widget.options)
+                session.states[widget.id] = ("string_value", option)
+            elif kind == "checkbox":
+                default = widget.default
+                session.states[widget.id] = ("bool_value", default or rng.random() < 0.3)
+
+async def _fetch(url):
+    def get():
+        with urllib.request.urlopen(url, timeout=60) as r:
+            return r.read()
+    return await asyncio.to_thread(get)
+
+async def run_session(base_url, scenario, rng, fetch=True):
+    """Runs one resident start to finish; returns {phase: seconds} and the PDF size"""
+    _, sidebar, form_choices = scenario
+    timings = {}
+    ws_url = base_url.replace("http://", "ws://") + "/_stcore/stream"
+    started = time.perf_counter()
+    async with websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None) as ws:
+        session = Session(ws)
+        await session.run()
+        timings["load"] = time.perf_counter() - started
+
+        # Sidebar choices can reveal further ones (Roofing -> roof action)
+        started = time.perf_counter()
+        pending = dict(sidebar)
+        while pending:
+            chosen = [label for label, option in pending.items() if session.choose(label, option)]
+            if not chosen:
+                raise SessionError(f"no widget for {', '.join(pending)}")
+            for label in chosen:
+                del pending[label]
+            await session.run()
+        timings["navigate"] = time.perf_counter() - started
+
+        submit = next((widget.id for kind, widget in session.widgets.get(SUBMIT_LABEL, ())
+                       if kind == "button"), None)
+        if submit is None:
+            raise SessionError(f"no {SUBMIT_LABEL!r} button")
+        fill_form(session, form_choices, rng)
+        started = time.perf_counter()
+        await session.run(trigger=submit)
+        # A queued PDF shows progress that polls until it is ready
+        while session.auto_rerun and not session.download_url:
+            interval, fragment_id = session.auto_rerun
+            await asyncio.sleep(interval)
+            await session.run(fragment_id=fragment_id)
+        timings["submit"] = time.perf_counter() - started
+
+        errors = [body for fmt, body in session.alerts if fmt == Alert.ERROR]
+        if errors:
+            raise SessionError(errors[0])
+        if not any(fmt == Alert.SUCCESS for fmt, _ in session.alerts) or not session.download_url:
+            raise SessionError("no generated PDF offered")
+
+    size = None
+    if fetch:
+        started = time.perf_counter()
+        url = session.download_url
+        pdf = await _fetch(url if url.startswith("http") else base_url + url)
+        timings["download"] = time.perf_counter() - started
+        if not pdf.startswith(b"%PDF-"):
+            raise SessionError("download is not a PDF")
+        size = len(pdf)
+    return timings, size
+
+# ==========================================
+# 3. LEVELS
+# ==========================================
+def summarize(seconds):
+    ms = sorted(s * 1000 for s in seconds)
+    if not ms:
+        return None
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 2),
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(ms[-1], 2),
+    }
+
+async def _sample_rss(server, peak, interval=0.1):
+    while True:
+        rss = server.rss_bytes()
+        if rss is not None:
+            peak[0] = max(peak[0], rss)
+        await asyncio.sleep(interval)
+
+async def run_level(server, concurrency, sessions, rng, fetch=True):
+    """`sessions` residents with at most `concurrency` at a time, scenarios in turn"""
+    queue = asyncio.Queue()
+    for i in range(sessions):
+        queue.put_nowait(SCENARIOS[i % len(SCENARIOS)])
+    phases = {phase: [] for phase in PHASES}
+    errors, sizes = [], []
+
+    async def resident():
+        while not queue.empty():
+            scenario = queue.get_nowait()
+            try:
+                timings, size = await run_session(server.url, scenario, random.Random(rng.random()), fetch)
+            except (SessionError, OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                errors.append(f"{scenario[0]}: {type(e).__name__}: {e}")
+                continue
+            for phase, seconds in timings.items():
+                phases[phase].append(seconds)
+            if size is not None:
+                sizes.append(size)
+
+    rss_start = server.rss_bytes()
+    peak = [rss_start or 0]
+    sampler = asyncio.create_task(_sample_rss(server, peak))
+    cpu_start, client_start = server.cpu_seconds(), os.times()
+    started = time.perf_counter()
+    await asyncio.gather(*(resident() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    cpu_end, client_end = server.cpu_seconds(), os.times()
+    sampler.cancel()
+
+    server_cpu = None if cpu_start is None else cpu_end - cpu_start
+    completed = len(phases["submit"])
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "completed": completed,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "seconds": round(elapsed, 3),
+        "sessions_per_s": round(completed / elapsed, 3),
+        "phases": {phase: summarize(values) for phase, values in phases.items()},
+        "mean_pdf_bytes": round(sum(sizes) / len(sizes)) if sizes else None,
+        "server_cpu_s": None if server_cpu is None else round(server_cpu, 3),
+        "server_cpu_pct": None if server_cpu is None else round(server_cpu / elapsed * 100, 1),
+        "client_cpu_s": round((client_end.user + client_end.system)
+                              - (client_start.user + client_start.system), 3),
+        "rss_start_mb": None if rss_start is None else round(rss_start / 2**20, 1),
+        "rss_peak_mb": round(peak[0] / 2**20, 1) if peak[0] else None,
+    }
+
+async def run_suite(levels=(1, 2, 4, 8), rounds=2, warmup=1, fetch=True, seed=2024, keep_dir=None):
+    """Runs every level against one fresh server; returns the results document"""
+    rng = random.Random(seed)
+    workdir = keep_dir or tempfile.mkdtemp(prefix="acc_loadtest_")
+    os.makedirs(workdir, exist_ok=True)
+    server = Server(os.path.join(workdir, "archive.db"), os.path.join(workdir, "streamlit.log"))
+    try:
+        await asyncio.to_thread(server.wait_ready)
+        # Templates load in the background on the first page view; let them
+        # finish, and every form's code path run once, before measuring
+        for _ in range(warmup):
+            for scenario in SCENARIOS:
+                await run_session(server.url, scenario, rng, fetch)
+        rss_idle = server.rss_bytes()
+        results = []
+        for concurrency in levels:
+            level = await run_level(server, concurrency, concurrency * rounds * len(SCENARIOS), rng, fetch)
+            results.append(level)
+            print_level(level)
+    finally:
+        server.stop()
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "streamlit": streamlit.__version__,
+            "levels": list(levels),
+            "rounds": rounds,
+            "warmup": warmup,
+            "fetch": fetch,
+            "seed": seed,
+            "rss_idle_mb": None if rss_idle is None else round(rss_idle / 2**20, 1),
+            "workdir": workdir,
+        },
+        "results": results,
+    }
+
+# ==========================================
+# 4. REPORTING
+# ==========================================
+def print_header():
+    print(f"{'sessions':>9}{'conc':>6}{'err':>5}{'sess/s':>8}{'load p50':>10}{'submit p50':>11}"
+          f"{'p95':>9}{'p99':>9}{'cpu %':>7}{'rss MB':>8}")
+
+def print_level(level):
+    submit = level["phases"]["submit"] or {}
+    load = level["phases"]["load"] or {}
+    cpu = level["server_cpu_pct"]
+    print(f"{level['sessions']:>9}{level['concurrency']:>6}{level['errors']:>5}{level['sessions_per_s']:>8.2f}"
+          f"{load.get('p50_ms', 0):>10.0f}{submit.get('p50_ms', 0):>11.0f}{submit.get('p95_ms', 0):>9.0f}"
+          f"{submit.get('p99_ms', 0):>9.0f}{cpu if cpu is not None else '-':>7}"
+          f"{level['rss_peak_mb'] or '-':>8}")
+    for error in level["error_samples"]:
+        print(f"    {error}")
+
+def compare(current, baseline, phase="submit", metric="p95_ms", tolerance=0.2):
+    """Rows of (concurrency, old, new, ratio, regressed) for levels in both runs"""
+    old_levels = {level["concurrency"]: level for level in baseline.get("results", [])}
+    rows = []
+    for level in current["results"]:
+        old = ((old_levels.get(level["concurrency"]) or {}).get("phases", {}).get(phase) or {}).get(metric)
+        new = (level["phases"].get(phase) or {}).get(metric)
+        if not old or new is None:
+            continue
+        ratio = new / old
+        rows.append((level["concurrency"], old, new, ratio, ratio > 1 + tolerance))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Streamlit app with concurrent sessions")
+    parser.add_argument("--levels", nargs="+", type=int, default=[1, 2, 4, 8],
+                        help="concurrent sessions at each step")
+    parser.add_argument("--rounds", type=int, default=2,
+                        help="passes over every form per concurrent session at each level")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured passes over every form first")
+    parser.add_argument("--no-fetch", dest="fetch", action="store_false",
+                        help="don't download the generated PDFs")
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--workdir", help="keep the server log and archive here instead of a temp dir")
+    parser.add_argument("-o", "--output", default="loadtest_results.json", help="where to save the JSON results")
+    parser.add_argument("--max-p95", type=float, help="fail if submit p95 (ms) exceeds this at any level")
+    parser.add_argument("--max-errors", type=int, default=0, help="fail if more sessions than this error")
+    parser.add_argument("--baseline", help="earlier results JSON to compare submit latency against")
+    parser.add_argument("--metric", default="p95_ms", help="submit summary field compared to the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown ratio over baseline that counts as a regression")
+    args = parser.parse_args(argv)
+
+    print_header()
+    doc = asyncio.run(run_suite(args.levels, args.rounds, args.warmup, args.fetch, args.seed, args.workdir))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
+    print(f"\nSaved {args.output}")
+
+    failures = []
+    errors = sum(level["errors"] for level in doc["results"])
+    if errors > args.max_errors:
+        failures.append(f"{errors} sessions failed (allowed {args.max_errors})")
+    if args.max_p95 is not None:
+        for level in doc["results"]:
+            p95 = (level["phases"]["submit"] or {}).get("p95_ms")
+            if p95 is None or p95 > args.max_p95:
+                failures.append(f"submit p95 {p95} ms at concurrency {level['concurrency']}"
+                                f" (limit {args.max_p95:g} ms)")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(doc, baseline, "submit", args.metric, args.tolerance)
+        print(f"\nAgainst {args.baseline} (submit {args.metric}, tolerance {args.tolerance:.0%}):")
+        for concurrency, old, new, ratio, bad in rows:
+            print(f"  {'SLOWER' if bad else 'ok    '} x{concurrency}: {old:.0f} -> {new:.0f} ms ({ratio:.2f}x)")
+            if bad:
+                failures.append(f"submit {args.metric} regressed {ratio:.2f}x at concurrency {concurrency}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
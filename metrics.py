@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-request instrumentation for the Lakes HOA ACC PDF pipeline
+
+Every generation runs inside a Span that marks the end of each stage
+(template, cache, overlay, merge, write, splice) and is finished with the bytes
+produced. Finished spans feed rolling aggregates over the last `window`
+requests per form, which export as Prometheus text or JSON lines, and can be
+appended to a JSONL log as they finish.
+
+While disabled, span() hands back one shared no-op span, so the hooks stay in
+the hot path at the cost of a few attribute lookups per request.
+"""
+import json
+import time
+import threading
+import tracemalloc
+from collections import deque
+
+# ==========================================
+# 1. SPANS
+# ==========================================
+class NullSpan:
+    """Stands in for a Span while metrics are off; every call does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def stage(self, name):
+        pass
+
+    def result(self, bytes_out, cache_hit=False):
+        pass
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    """Timings for one request. stage(name) closes the stage that just ran;
+    result() records what the request produced."""
+    __slots__ = ("recorder", "form_type", "mode", "started", "stages", "bytes_out",
+                 "cache_hit", "peak_bytes", "error", "_t0", "_last", "_mem_base")
+
+    def __init__(self, recorder, form_type, mode):
+        self.recorder = recorder
+        self.form_type = form_type
+        self.mode = mode
+        self.stages = {}
+        self.bytes_out = None
+        self.cache_hit = None
+        self.peak_bytes = None
+        self.error = None
+        self._mem_base = None
+
+    def __enter__(self):
+        if self.recorder.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self._mem_base = tracemalloc.get_traced_memory()[0]
+        self.started = time.time()
+        self._t0 = self._last = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        now = time.perf_counter()
+        if self._mem_base is not None:
+            self.peak_bytes = max(tracemalloc.get_traced_memory()[1] - self._mem_base, 0)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.recorder.record(self, now)
+        return False
+
+    def stage(self, name):
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def result(self, bytes_out, cache_hit=False):
+        self.bytes_out = bytes_out
+        self.cache_hit = cache_hit
+
+    def as_dict(self, total):
+        return {
+            "ts": round(self.started, 3),
+            "form_type": self.form_type,
+            "mode": self.mode,
+            "total_ms": round(total * 1000, 4),
+            "stages_ms": {name: round(s * 1000, 4) for name, s in self.stages.items()},
+            "bytes_out": self.bytes_out,
+            "cache_hit": self.cache_hit,
+            "peak_bytes": self.peak_bytes,
+            "error": self.error,
+        }
+
+# ==========================================
+# 2. RECORDER
+# ==========================================
+def _quantile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+def _labels(**labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+class Recorder:
+    """Collects finished spans: running totals plus the last `window` per form and mode.
+
+    trace_memory starts tracemalloc and records each span's peak; the peak is
+    process-wide, so spans running at the same time see each other's memory.
+    """
+    QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+    def __init__(self, enabled=False, trace_memory=False, window=1000, log_path=None):
+        self._lock = threading.Lock()
+        self.window = window
+        self._log = None
+        self.reset()
+        self.enabled = False
+        self.trace_memory = False
+        if enabled:
+            self.enable(trace_memory, log_path)
+
+    def enable(self, trace_memory=False, log_path=None):
+        """Turns recording on; log_path appends one JSON line per finished span"""
+        with self._lock:
+            if trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self.trace_memory = trace_memory
+            if log_path and self._log is None:
+                self._log = open(log_path, "a", encoding="utf-8", buffering=1)
+            self.enabled = True
+
+    def disable(self):
+        with self._lock:
+            self.enabled = False
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def reset(self):
+        with self._lock:
+            self._recent = {}
+            self._totals = {}
+
+    def span(self, form_type, mode="splice"):
+        """A Span to run one request in, or NULL_SPAN while disabled"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, form_type, mode)
+
+    def record(self, span, finished):
+        total = finished - span._t0
+        row = span.as_dict(total)
+        line = json.dumps(row) if self._log is not None else None
+        with self._lock:
+            key = (span.form_type, span.mode)
+            recent = self._recent.get(key)
+            if recent is None:
+                recent = self._recent[key] = deque(maxlen=self.window)
+            recent.append(row)
+
+            totals = self._totals.setdefault(key, {
+                "requests": 0, "errors": 0, "cache_hits": 0, "bytes_out": 0,
+                "seconds": 0.0, "stages": {}})
+            totals["requests"] += 1
+            totals["errors"] += span.error is not None
+            totals["cache_hits"] += bool(span.cache_hit)
+            totals["bytes_out"] += span.bytes_out or 0
+            totals["seconds"] += total
+            for name, seconds in span.stages.items():
+                count, sum_ = totals["stages"].get(name, (0, 0.0))
+                totals["stages"][name] = (count + 1, sum_ + seconds)
+            if line is not None and self._log is not None:
+                self._log.write(line + "\n")
+
+    # ------------------------------------------
+    # Exports
+    # ------------------------------------------
+    def _window(self):
+        """Finished spans in the window and the running totals, per (form, mode)"""
+        with self._lock:
+            recent = {key: list(rows) for key, rows in self._recent.items()}
+            totals = {key: dict(value, stages=dict(value["stages"])) for key, value in self._totals.items()}
+        return recent, totals
+
+    @staticmethod
+    def _stage_values(rows):
+        stages = {}
+        for row in rows:
+            for name, ms in row["stages_ms"].items():
+                stages.setdefault(name, []).append(ms)
+        for values in stages.values():
+            values.sort()
+        return stages
+
+    def aggregates(self):
+        """{form: {mode: summary}} of total and per-stage ms quantiles over the window"""
+        recent, _ = self._window()
+        result = {}
+        for (form, mode), rows in sorted(recent.items()):
+            totals = sorted(row["total_ms"] for row in rows)
+            peaks = [row["peak_bytes"] for row in rows if row["peak_bytes"] is not None]
+            result.setdefault(form, {})[mode] = {
+                "window": len(rows),
+                "total_ms": {f"p{round(q * 100)}": round(_quantile(totals, q), 4) for q in self.QUANTILES},
+                "stages_ms": {name: {f"p{round(q * 100)}": round(_quantile(values, q), 4)
+                                     for q in self.QUANTILES}
+                              for name, values in self._stage_values(rows).items()},
+                "bytes_out": sum(row["bytes_out"] or 0 for row in rows),
+                "cache_hits": sum(bool(row["cache_hit"]) for row in rows),
+                "errors": sum(row["error"] is not None for row in rows),
+                "max_peak_bytes": max(peaks) if peaks else None,
+            }
+        return result
+
+    def jsonl(self):
+        """The spans still in the window, oldest first, one JSON object per line"""
+        recent, _ = self._window()
+        rows = sorted((row for rows in recent.values() for row in rows), key=lambda row: row["ts"])
+        return "".join(json.dumps(row) + "\n" for row in rows)
+
+    def prometheus(self, prefix="acc_pdf"):
+        """Prometheus text format: counters since start, summaries whose
+        quantiles cover the window and whose _sum/_count cover all time"""
+        recent, totals = self._window()
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        for name, field, help_text in (("requests_total", "requests", "Generations finished"),
+                                       ("errors_total", "errors", "Generations that raised"),
+                                       ("cache_hits_total", "cache_hits", "Generations served from the result cache"),
+                                       ("bytes_out_total", "bytes_out", "PDF bytes produced")):
+            header(name, "counter", help_text)
+            for (form, mode), t in sorted(totals.items()):
+                lines.append(f"{prefix}_{name}{{{_labels(form=form, mode=mode)}}} {t[field]}")
+
+        header("request_seconds", "summary", "Whole-request latency")
+        for (form, mode), t in sorted(totals.items()):
+            values = sorted(row["total_ms"] / 1000 for row in recent.get((form, mode), ()))
+            for q in self.QUANTILES:
+                lines.append(f"{prefix}_request_seconds{{{_labels(form=form, mode=mode, quantile=q)}}} "
+                             f"{_quantile(values, q):.6f}")
+            labels = _labels(form=form, mode=mode)
+            lines.append(f"{prefix}_request_seconds_sum{{{labels}}} {t['seconds']:.6f}")
+            lines.append(f"{prefix}_request_seconds_count{{{labels}}} {t['requests']}")
+
+        header("stage_seconds", "summary", "Latency of each pipeline stage")
+        for (form, mode), t in sorted(totals.items()):
+            windowed = self._stage_values(recent.get((form, mode), ()))
+            for stage, (count, seconds) in sorted(t["stages"].items()):
+                values = windowed.get(stage, [])
+                for q in self.QUANTILES:
+                    lines.append(f"{prefix}_stage_seconds{{{_labels(form=form, mode=mode, stage=stage, quantile=q)}}} "
+                                 f"{_quantile(values, q) / 1000:.6f}")
+                labels = _labels(form=form, mode=mode, stage=stage)
+                lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {seconds:.6f}")
+                lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {count}")
+
+        peaks = {key: max(peaks) for key, rows in recent.items()
+                 if (peaks := [row["peak_bytes"] for row in rows if row["peak_bytes"] is not None])}
+        if peaks:
+            header("peak_memory_bytes", "gauge", "Largest tracemalloc peak in the window")
+            for (form, mode), peak in sorted(peaks.items()):
+                lines.append(f"{prefix}_peak_memory_bytes{{{_labels(form=form, mode=mode)}}} {peak}")
+        return "\n".join(lines) + "\n"
+
+# Process-wide recorder the engine reports to; off until something enables it
+METRICS = Recorder()
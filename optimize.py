@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Output size optimizer for the Lakes HOA ACC templates
+
+The templates come out of "Print To PDF" with complete TrueType fonts embedded
+and a plain xref table, so every generated application is at least as big as
+its template. optimize_pdf rewrites a template once:
+
+  * embedded fonts are cut down to the glyphs the pages actually draw
+    (needs fontTools; skipped without it)
+  * identical objects are merged and orphans dropped
+  * streams with no filter are Flate-compressed
+  * images drawn above `image_dpi` are downsampled (optional, needs Pillow)
+  * everything that is not a stream is packed into object streams behind a
+    cross-reference stream
+
+pdf_engine keeps the result per template (TemplateCache.get(src, optimize=True)),
+so requests only pay for it once.
+
+share_fonts folds the copies of one font that several templates embed into a
+single file, for documents built from more than one template (bundles).
+
+    python optimize.py --image-dpi 150
+"""
+import io
+import sys
+import copy
+import math
+import logging
+import time
+import struct
+import argparse
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (ArrayObject, ByteStringObject, ContentStream, DecodedStreamObject,
+                           NameObject, NumberObject, StreamObject,
+                           TextStringObject)
+
+# Non-stream objects per object stream
+OBJECTS_PER_STREAM = 100
+
+# Only images at least this much over the target DPI are worth re-encoding
+DPI_SLACK = 1.25
+JPEG_QUALITY = 85
+
+TEXT_OPS = (b"Tj", b"TJ", b"'", b'"')
+
+# ==========================================
+# 1. FONT SUBSETTING
+# ==========================================
+def _string_bytes(value):
+    # TextStringObject decodes what it can; original_bytes is what the
+    # content stream actually held (2-byte CIDs for Identity-H fonts)
+    if isinstance(value, TextStringObject):
+        return value.original_bytes
+    if isinstance(value, ByteStringObject):
+        return bytes(value)
+    return b""
+
+def _font_descriptor(font):
+    """(FontDescriptor with a FontFile2 or None, whether glyph ids can be read off its strings)"""
+    readable = font.get("/Subtype") == "/Type0" and font.get("/Encoding") in ("/Identity-H", "/Identity-V")
+    if font.get("/Subtype") == "/Type0":
+        font = font["/DescendantFonts"][0].get_object()
+        readable = (readable and font.get("/Subtype") == "/CIDFontType2"
+                    and font.get("/CIDToGIDMap", "/Identity") == "/Identity")
+    descriptor = font.get("/FontDescriptor")
+    if descriptor is None or "/FontFile2" not in descriptor.get_object():
+        return None, False
+    return descriptor.get_object(), readable
+
+def _font_file(font):
+    """(FontFile2 reference or None, whether glyph ids can be read off its strings)"""
+    descriptor, readable = _font_descriptor(font)
+    if descriptor is None:
+        return None, False
+    return descriptor.raw_get("/FontFile2"), readable
+
+def used_glyphs(writer):
+    """Glyph ids drawn per embedded TrueType font file: {idnum: (reference, gids)}.
+
+    Only Identity-H CID fonts are read. A font file also reached through any
+    other kind of font, or through a form XObject, is left out so it is never
+    cut down.
+    """
+    glyphs = {}
+    files = {}
+
+    def register(font, readable=True):
+        ref, can_read = _font_file(font.get_object())
+        if ref is None:
+            return None
+        files[ref.idnum] = ref
+        if not (readable and can_read):
+            glyphs[ref.idnum] = None
+        elif ref.idnum not in glyphs:
+            glyphs[ref.idnum] = set()
+        return glyphs[ref.idnum]
+
+    for page in writer.pages:
+        resources = page.get("/Resources") or {}
+        fonts = resources.get("/Font") or {}
+        for font in fonts.values():
+            register(font)
+        for xobject in (resources.get("/XObject") or {}).values():
+            xobject = xobject.get_object()
+            if xobject.get("/Subtype") == "/Form":
+                for font in ((xobject.get("/Resources") or {}).get("/Font") or {}).values():
+                    register(font, readable=False)
+
+        current = None
+        for operands, op in ContentStream(page.get_contents(), writer).operations:
+            if op == b"Tf":
+                current = register(fonts[operands[0]]) if operands[0] in fonts else None
+            elif op in TEXT_OPS and current is not None:
+                strings = operands[0] if op == b"TJ" else operands[-1:]
+                for value in strings:
+                    raw = _string_bytes(value)
+                    current.update(int.from_bytes(raw[i:i + 2], "big")
+                                   for i in range(0, len(raw) - 1, 2))
+
+    return {idnum: (files[idnum], gids) for idnum, gids in glyphs.items() if gids is not None}
+
+def subset_fonts(writer):
+    """Cuts every readable embedded CID font down to its used glyphs.
+
+    Glyph ids are kept in place (retain_gids), so the content streams, /W
+    widths and CIDToGIDMap stay valid as they are. Returns (bytes before,
+    bytes after) of the font files, compressed.
+    """
+    # Imported here rather than at the top, since this only runs once per
+    # template and the import is not cheap
+    try:
+        from fontTools import subset as ft_subset
+        from fontTools.ttLib import TTFont
+    except ImportError:  # fonts are left whole
+        return 0, 0
+    # Tables it can't subset (meta, LTSH, PCLT) are dropped with a warning each
+    logging.getLogger("fontTools.subset").setLevel(logging.ERROR)
+
+    before = after = 0
+    for ref, gids in used_glyphs(writer).values():
+        stream = ref.get_object()
+        font = TTFont(io.BytesIO(stream.get_data()))
+        options = ft_subset.Options()
+        options.retain_gids = True
+        options.notdef_outline = True
+        options.glyph_names = False
+        options.name_IDs = ["*"]
+        options.recalc_bounds = False
+        options.layout_features = []
+        options.drop_tables += ["GSUB", "GPOS", "GDEF", "kern", "morx", "JSTF", "BASE"]
+        subsetter = ft_subset.Subsetter(options)
+        subsetter.populate(gids=sorted(gids | {0}))
+        subsetter.subset(font)
+        out = io.BytesIO()
+        font.save(out)
+
+        before += len(stream._data)
+        stream.set_data(out.getvalue())
+        stream[NameObject("/Length1")] = NumberObject(len(out.getvalue()))
+        after += len(stream._data)
+    return before, after
+
+def share_fonts(writer):
+    """Points every embedded copy of the same TrueType font at one font file.
+
+    The templates each embed their own subset of the same Arial, Times New
+    Roman, etc. Glyph ids are kept in place in all of them, so the copies can
+    be folded into one file holding every glyph any of them draws. Only
+    Identity-H CID fonts are touched, where the font's own cmap is never used.
+    Returns how many font files were dropped.
+    """
+    try:
+        from fontTools.ttLib import TTFont
+    except ImportError:  # each font keeps its own file
+        return 0
+
+    descriptors = {}
+    for page in writer.pages:
+        for font in (((page.get("/Resources") or {}).get("/Font")) or {}).values():
+            descriptor, readable = _font_descriptor(font.get_object())
+            if descriptor is not None and readable:
+                descriptors.setdefault(descriptor.raw_get("/FontFile2").idnum, []).append(descriptor)
+
+    groups = {}
+    for idnum, users in descriptors.items():
+        ref = users[0].raw_get("/FontFile2")
+        font = TTFont(io.BytesIO(ref.get_object().get_data()))
+        if "glyf" not in font:
+            continue
+        key = (font["name"].getDebugName(4), font["head"].fontRevision,
+               font["maxp"].numGlyphs, font["head"].unitsPerEm)
+        groups.setdefault(key, []).append((ref, font, users))
+
+    dropped = 0
+    for copies in groups.values():
+        if len(copies) < 2:
+            continue
+        ref, base, _ = copies[0]
+        glyf, hmtx, order = base["glyf"], base["hmtx"], base.getGlyphOrder()
+        for _, font, users in copies[1:]:
+            # Copies may name their glyphs differently; ids are what match
+            for gid, name in enumerate(font.getGlyphOrder()):
+                glyph = font["glyf"][name]
+                if glyph.numberOfContours == 0 or glyf[order[gid]].numberOfContours != 0:
+                    continue
+                if glyph.isComposite():
+                    glyph = copy.deepcopy(glyph)
+                    for component in glyph.components:
+                        component.glyphName = order[font.getGlyphID(component.glyphName)]
+                glyf[order[gid]] = glyph
+                hmtx[order[gid]] = font["hmtx"][name]
+            for descriptor in users:
+                descriptor[NameObject("/FontFile2")] = ref
+            dropped += 1
+        out = io.BytesIO()
+        base.save(out)
+        stream = ref.get_object()
+        stream.set_data(out.getvalue())
+        stream[NameObject("/Length1")] = NumberObject(len(out.getvalue()))
+    return dropped
+
+# ==========================================
+# 2. IMAGE DOWNSAMPLING
+# ==========================================
+def _multiply(m, n):
+    a, b, c, d, e, f = m
+    return (a * n[0] + b * n[2], a * n[1] + b * n[3],
+            c * n[0] + d * n[2], c * n[1] + d * n[3],
+            e * n[0] + f * n[2] + n[4], e * n[1] + f * n[3] + n[5])
+
+def image_extents(page, writer):
+    """Largest size in points each image XObject of a page is drawn at"""
+    ctm = (1, 0, 0, 1, 0, 0)
+    stack = []
+    extents = {}
+    for operands, op in ContentStream(page.get_contents(), writer).operations:
+        if op == b"q":
+            stack.append(ctm)
+        elif op == b"Q":
+            ctm = stack.pop() if stack else (1, 0, 0, 1, 0, 0)
+        elif op == b"cm":
+            ctm = _multiply(tuple(float(v) for v in operands), ctm)
+        elif op == b"Do":
+            width = math.hypot(ctm[0], ctm[1])
+            height = math.hypot(ctm[2], ctm[3])
+            old = extents.get(operands[0], (0, 0))
+            extents[operands[0]] = (max(old[0], width), max(old[1], height))
+    return extents
+
+def downsample_images(writer, dpi):
+    """Re-encodes images drawn at more than `dpi` down to `dpi`; returns how many"""
+    try:
+        from PIL import Image
+    except ImportError:  # images are left alone
+        return 0
+    done = set()
+    for page in writer.pages:
+        xobjects = (page.get("/Resources") or {}).get("/XObject") or {}
+        for name, (width_pt, height_pt) in image_extents(page, writer).items():
+            if name not in xobjects:
+                continue
+            ref = xobjects.raw_get(name)
+            if ref.idnum in done:
+                continue
+            image = ref.get_object()
+            if (image.get("/Subtype") != "/Image" or image.get("/ImageMask")
+                    or "/SMask" in image or "/Mask" in image or image.get("/BitsPerComponent") != 8
+                    or image.get("/ColorSpace") not in ("/DeviceRGB", "/DeviceGray")):
+                continue
+            width, height = int(image["/Width"]), int(image["/Height"])
+            if not (width_pt and height_pt):
+                continue
+            # Scale uniformly, so the less detailed axis decides
+            current = min(width / (width_pt / 72), height / (height_pt / 72))
+            if current <= dpi * DPI_SLACK:
+                continue
+            scale = dpi / current
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            pil = page.images[name].image.resize(size, Image.LANCZOS)
+            page.images[name].replace(pil, quality=JPEG_QUALITY)
+            done.add(ref.idnum)
+    return len(done)
+
+# ==========================================
+# 3. COMPACT SERIALIZER
+# ==========================================
+def write_object(out, idnum, obj):
+    offset = out.tell()
+    out.write(b"%d 0 obj\n" % idnum)
+    obj.write_to_stream(out)
+    out.write(b"\nendobj\n")
+    return offset
+
+def xref_stream(entries, size, trailer):
+    """A cross-reference stream for `entries`: {idnum: (type, field2, field3)}.
+
+    Only the listed objects are indexed, which is also what an incremental
+    update needs. `trailer` supplies /Root, /Info, /ID and /Prev.
+    """
+    ids = sorted(entries)
+    index = []
+    for idnum in ids:
+        if index and index[-2] + index[-1] == idnum:
+            index[-1] += 1
+        else:
+            index += [idnum, 1]
+    stream = DecodedStreamObject()
+    stream.set_data(b"".join(struct.pack(">BIH", *entries[idnum]) for idnum in ids))
+    stream.update({NameObject(key): value for key, value in trailer.items()})
+    stream[NameObject("/Type")] = NameObject("/XRef")
+    stream[NameObject("/Size")] = NumberObject(size)
+    stream[NameObject("/W")] = ArrayObject([NumberObject(1), NumberObject(4), NumberObject(2)])
+    stream[NameObject("/Index")] = ArrayObject(NumberObject(n) for n in index)
+    return stream.flate_encode(level=9)
+
+def write_compact(reader):
+    """Serializes a single-revision PDF with object streams and an xref stream"""
+    out = io.BytesIO()
+    out.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+    size = int(reader.trailer["/Size"])
+    present = reader.xref.get(0, {})
+    entries = {0: (0, 0, 65535)}
+    packed = []
+    for idnum in range(1, size):
+        obj = reader.get_object(idnum) if idnum in present else None
+        if obj is None:
+            entries[idnum] = (0, 0, 0)
+        elif isinstance(obj, StreamObject):
+            if "/Filter" not in obj:
+                obj = obj.flate_encode(level=9)
+            entries[idnum] = (1, write_object(out, idnum, obj), 0)
+        else:
+            packed.append((idnum, obj))
+
+    next_id = size
+    for start in range(0, len(packed), OBJECTS_PER_STREAM):
+        chunk = packed[start:start + OBJECTS_PER_STREAM]
+        header, body = [], io.BytesIO()
+        for position, (idnum, obj) in enumerate(chunk):
+            header.append(b"%d %d" % (idnum, body.tell()))
+            obj.write_to_stream(body)
+            body.write(b"\n")
+            entries[idnum] = (2, next_id, position)
+        header = b" ".join(header) + b"\n"
+        stream = DecodedStreamObject()
+        stream.set_data(header + body.getvalue())
+        stream[NameObject("/Type")] = NameObject("/ObjStm")
+        stream[NameObject("/N")] = NumberObject(len(chunk))
+        stream[NameObject("/First")] = NumberObject(len(header))
+        entries[next_id] = (1, write_object(out, next_id, stream.flate_encode(level=9)), 0)
+        next_id += 1
+
+    trailer = {key: reader.trailer.raw_get(key)
+               for key in ("/Root", "/Info", "/ID") if key in reader.trailer}
+    entries[next_id] = (1, out.tell(), 0)
+    xref_offset = write_object(out, next_id, xref_stream(entries, next_id + 1, trailer))
+    out.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+    return out.getvalue()
+
+# ==========================================
+# 4. DRIVER
+# ==========================================
+def optimize_pdf(data, image_dpi=None):
+    """Optimized copy of the PDF in `data`; returns (pdf bytes, size report)"""
+    started = time.perf_counter()
+    writer = PdfWriter(clone_from=io.BytesIO(data))
+    report = {"original_bytes": len(data)}
+
+    report["font_bytes_before"], report["font_bytes_after"] = subset_fonts(writer)
+    report["images_downsampled"] = downsample_images(writer, image_dpi) if image_dpi else 0
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+
+    # A plain write first renumbers whatever the steps above left behind
+    plain = io.BytesIO()
+    writer.write(plain)
+    pdf = write_compact(PdfReader(plain))
+
+    report["optimized_bytes"] = len(pdf)
+    report["saved_percent"] = round(100 * (1 - len(pdf) / len(data)), 1) if data else 0
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return pdf, report
+
+def main(argv=None):
+    import pdf_engine
+    from forms import sample_records
+
+    parser = argparse.ArgumentParser(description="Report how much optimize mode saves per template")
+    parser.add_argument("--image-dpi", type=int, default=None, help="downsample images drawn above this DPI")
+    args = parser.parse_args(argv)
+
+    templates = pdf_engine.TemplateCache(image_dpi=args.image_dpi)
+    print(f"{'form':<10}{'template':>12}{'optimized':>12}{'saved':>8}{'output':>12}"
+          f"{'optimized':>12}{'build s':>9}")
+    for form_type, spec in pdf_engine.FORMS.items():
+        report = templates.get(spec.template, optimize=True).report
+        data = sample_records(spec.compiled)[0]
+        plain = len(pdf_engine.generate_pdf_bytes(data, form_type, templates))
+        small = len(pdf_engine.generate_pdf_bytes(data, form_type, templates, optimize=True))
+        print(f"{form_type:<10}{report['original_bytes']:>12,}{report['optimized_bytes']:>12,}"
+              f"{report['saved_percent']:>7}%{plain:>12,}{small:>12,}{report['seconds']:>9}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,893 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF engine for the Lakes HOA ACC applications (Painting, Remodel, Roofing, Solar)
+
+Overlay drawing, template caching, final PDF assembly and result caching. Kept out of app.py
+so it is imported once per process instead of re-run on every Streamlit rerun,
+and so it can be used without a Streamlit session.
+"""
+import io
+import os
+import json
+import hashlib
+import threading
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from pypdf import PdfWriter, PdfReader
+from pypdf.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject,
+                           IndirectObject, NameObject, NumberObject, TextStringObject)
+from optimize import optimize_pdf, share_fonts, write_compact, write_object, xref_stream
+from metrics import METRICS, NULL_SPAN
+from attachments import MAX_ATTACHMENT_BYTES, append_attachments
+# Form types, their templates, page maps and layouts live in forms.py
+from forms import BASE_DIR, FORMS, sample_records
+
+# Output is handed to sockets and files in pieces of this size
+CHUNK_SIZE = 64 * 1024
+
+# ==========================================
+# 1. TEMPLATE CACHE
+# ==========================================
+class Template:
+    """A parsed ACC template: raw bytes plus the PdfReader built from them.
+
+    `compact` marks bytes that optimize_pdf already wrote; their skeleton is
+    the bytes themselves rather than a PdfWriter copy.
+    """
+    def __init__(self, path, data, stat=None, compact=False):
+        self.path = path
+        self.data = data
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        self.mtime_ns = stat.st_mtime_ns if stat else None
+        self.size = stat.st_size if stat else len(data)
+        self.reader = PdfReader(io.BytesIO(data))
+        # PdfReader resolves objects lazily by seeking its stream, so only one
+        # thread may copy pages out of it at a time
+        self.lock = threading.Lock()
+        self.compact = compact
+        self.report = None
+        # Bundles only: bundle page index of each overlay page, per form type
+        self.form_pages = None
+        self._skeleton = None
+        self._optimized = {}
+        self._with_fields = {}
+
+    def skeleton(self):
+        """The pre-serialized Skeleton of this template, built on first use"""
+        with self.lock:
+            if self._skeleton is None:
+                self._skeleton = Skeleton(self.reader, self.data if self.compact else None)
+            return self._skeleton
+
+    def optimized(self, image_dpi=None):
+        """This template run through optimize_pdf, built once per image_dpi.
+
+        The result is a Template of its own, with its own hash, reader and
+        skeleton; its `report` holds the sizes before and after.
+        """
+        with self.lock:
+            entry = self._optimized.get(image_dpi)
+            if entry is None:
+                pdf, report = optimize_pdf(self.data, image_dpi)
+                entry = Template(self.path, pdf, compact=True)
+                entry.report = report
+                self._optimized[image_dpi] = entry
+            return entry
+
+    def with_fields(self, spec):
+        """This template with an AcroForm field per entry of a FormSpec's layout,
+        built on first use for each revision of the layout"""
+        with self.lock:
+            entry = self._with_fields.get(spec.digest)
+            if entry is None:
+                entry = Template(self.path, add_form_fields(self.reader, spec.compiled, spec.pages))
+                self._with_fields[spec.digest] = entry
+            return entry
+
+class TemplateCache:
+    """Process-wide cache of parsed templates.
+
+    An entry is re-checked with os.stat on every lookup. When the mtime or size
+    changes the file is re-read; it is only re-parsed if its hash changed too.
+    get(src, optimize=True) returns the optimized copy instead, which is
+    dropped along with its entry when the file changes. When the form
+    registry changes, templates no form uses any more are dropped too, and
+    so are bundles built from a form definition or template that has changed.
+    """
+    def __init__(self, base_dir=BASE_DIR, image_dpi=None):
+        self.base_dir = base_dir
+        self.image_dpi = image_dpi
+        self._entries = {}
+        self._bundles = {}
+        self._forms_version = FORMS.version
+        self._bundles_stale = False
+        self._lock = threading.Lock()
+        # Reentrant: building a bundle looks its templates up, which may prune
+        self._bundle_lock = threading.RLock()
+
+    def get(self, src, optimize=False):
+        if self._forms_version != FORMS.version:
+            self._prune()
+        entry = self._load(os.path.join(self.base_dir, src))
+        if self._bundles_stale:
+            self._prune_bundles()
+        return entry.optimized(self.image_dpi) if optimize else entry
+
+    def bundle(self, form_types, optimize=False, form_pages_only=False):
+        """The templates of form_types as one document (build_bundle), built
+        once per combination and rebuilt when any of them changes"""
+        form_types = tuple(form_types)
+        specs = [FORMS[form_type] for form_type in form_types]
+        members = tuple((spec.digest, self.get(spec.template, optimize).sha256) for spec in specs)
+        key = (form_types, optimize, form_pages_only)
+        with self._bundle_lock:
+            built, entry = self._bundles.get(key, (None, None))
+            if built != members:
+                data, form_pages = build_bundle(form_types, self, optimize, form_pages_only)
+                entry = Template("+".join(form_types), data, compact=True)
+                entry.form_pages = form_pages
+                self._bundles[key] = (members, entry)
+            return entry
+
+    def _load(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and (entry.mtime_ns, entry.size) == (stat.st_mtime_ns, stat.st_size):
+                return entry
+
+            with open(path, "rb") as f:
+                data = f.read()
+            if entry and hashlib.sha256(data).hexdigest() == entry.sha256:
+                entry.mtime_ns, entry.size = stat.st_mtime_ns, stat.st_size
+                return entry
+
+            if entry:
+                self._bundles_stale = True
+            entry = Template(path, data, stat)
+            self._entries[path] = entry
+            return entry
+
+    def _prune(self):
+        with self._lock:
+            self._forms_version = FORMS.version
+            used = {os.path.join(self.base_dir, spec.template) for spec in FORMS.values()}
+            for path in [path for path in self._entries if path not in used]:
+                del self._entries[path]
+        self._prune_bundles()
+
+    def _prune_bundles(self):
+        """Drops bundles whose members' form digests or template hashes are gone"""
+        self._bundles_stale = False
+        digests = {spec.digest for spec in FORMS.values()}
+        with self._lock:
+            shas = set()
+            for entry in self._entries.values():
+                shas.add(entry.sha256)
+                shas.update(optimized.sha256 for optimized in entry._optimized.values())
+        with self._bundle_lock:
+            for key in [key for key, (members, _) in self._bundles.items()
+                        if any(digest not in digests or sha not in shas for digest, sha in members)]:
+                del self._bundles[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        with self._bundle_lock:
+            self._bundles.clear()
+
+# Default cache for callers that don't bring their own (scripts, workers)
+TEMPLATES = TemplateCache()
+
+def warm_templates(templates=None, optimize=False):
+    """Parses every form's template and builds its skeleton ahead of the first request"""
+    templates = templates or TEMPLATES
+    for spec in FORMS.values():
+        templates.get(spec.template, optimize).skeleton()
+
+def prewarm(templates=None, optimize=False):
+    """warm_templates plus one throwaway generation per form and branch, so the
+    first real request runs at steady-state speed. Meant for a background
+    thread at startup.
+    """
+    templates = templates or TEMPLATES
+    for variant in ((True, False) if optimize else (False,)):
+        warm_templates(templates, variant)
+        for form_type, spec in FORMS.items():
+            for data in sample_records(spec.compiled):
+                splice_final_pdf(data, form_type, templates, variant)
+
+def prewarm_in_background(templates=None, optimize=False):
+    """Starts prewarm() on a daemon thread and returns the thread"""
+    thread = threading.Thread(target=prewarm, args=(templates, optimize),
+                              name="pdf-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+# ==========================================
+# 2. OVERLAY ENGINE
+# ==========================================
+def render_overlay(compiled, data):
+    """Draws the filled-in fields of a compiled layout onto a fresh overlay PDF"""
+    # Only the merge path draws with reportlab, so only it pays for the import
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+
+    packet = io.BytesIO()
+    can = canvas.Canvas(packet, pagesize=letter)
+    can.setFont("Helvetica", 10)
+
+    get = data.get
+    for page_no, fields in enumerate(compiled):
+        if page_no:
+            can.showPage()
+        for is_check, x, y, key, when in fields:
+            value = get(key)
+            if not value or (when and get(when[0]) != when[1]):
+                continue
+            can.drawString(x, y, "X" if is_check else str(value))
+
+    can.save()
+    packet.seek(0)
+    return packet
+
+# ==========================================
+# 3. PDF GENERATION LOGIC
+# ==========================================
+def generate_final_pdf(data, form_type, templates=None, optimize=False, span=NULL_SPAN):
+    templates = templates or TEMPLATES
+    spec = FORMS[form_type]
+    template = templates.get(spec.template, optimize)
+    span.stage("template")
+    overlay = render_overlay(spec.compiled, data)
+    span.stage("overlay")
+    output = merge_final_pdf(overlay, form_type, template)
+    span.stage("merge")
+    return output
+
+def merge_final_pdf(overlay, form_type, template):
+    """Merges a rendered overlay onto a cached Template; returns the PdfWriter"""
+    new_pdf = PdfReader(overlay)
+    # Template page index -> the overlay page drawn on it (the form's page map)
+    overlays = {index: new_pdf.pages[page_no]
+                for page_no, index in enumerate(FORMS[form_type].pages) if page_no < len(new_pdf.pages)}
+    output = PdfWriter()
+
+    # add_page copies each page into the writer; merging onto that copy keeps
+    # the cached template pages untouched for the next request
+    with template.lock:
+        for index, page in enumerate(template.reader.pages):
+            added = output.add_page(page)
+            if index in overlays:
+                added.merge_page(overlays[index])
+
+    return output
+
+class ChunkWriter:
+    """Write-only stream that hands PdfWriter output on in chunks.
+
+    pypdf only needs write() and tell() from its output stream; tell() is a
+    running byte count, so the xref offsets are right without ever holding
+    the whole document in memory.
+    """
+    def __init__(self, emit, chunk_size=CHUNK_SIZE):
+        self.emit = emit
+        self.chunk_size = chunk_size
+        self.position = 0
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        self.position += len(data)
+        if len(self._buf) >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        if self._buf:
+            self.emit(bytes(self._buf))
+            self._buf.clear()
+
+def stream_final_pdf(data, form_type, emit, templates=None, chunk_size=CHUNK_SIZE, mode="splice",
+                     optimize=False):
+    """Serializes the final PDF straight into emit(chunk); returns bytes written"""
+    with METRICS.span(form_type, mode + "-optimized" if optimize else mode) as span:
+        if mode == "merge" or mode in FILL_MODES:
+            sink = ChunkWriter(emit, chunk_size)
+            if mode == "merge":
+                output = generate_final_pdf(data, form_type, templates, optimize, span)
+            else:
+                output = fill_final_pdf(data, form_type, templates, optimize, FILL_MODES[mode], span)
+            output.write(sink)
+            sink.flush()
+            span.stage("write")
+            span.result(sink.position)
+            return sink.position
+
+        total = 0
+        for part in splice_final_pdf(data, form_type, templates, optimize, span):
+            for chunk in iter_chunks(part, chunk_size):
+                emit(chunk)
+            total += len(part)
+        span.stage("write")
+        span.result(total)
+        return total
+
+def iter_chunks(pdf, chunk_size=CHUNK_SIZE):
+    """Slices finished PDF bytes into chunks without copying them"""
+    view = memoryview(pdf)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+# tracemalloc keeps one peak for the whole process; see peak_memory
+_PEAK_LOCK = threading.Lock()
+
+@contextmanager
+def peak_memory():
+    """Records the peak Python allocation inside the block as result["peak_bytes"].
+
+    Starts tracemalloc for the block if nothing else has. The peak is
+    process-wide, and each block resets it, so blocks run one at a time: a
+    block waits for any other to finish first, and its peak is its own as
+    long as nothing outside a block allocates meanwhile.
+    """
+    with _PEAK_LOCK:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = {}
+        try:
+            yield result
+        finally:
+            result["peak_bytes"] = max(tracemalloc.get_traced_memory()[1] - base, 0)
+            if started:
+                tracemalloc.stop()
+
+# ==========================================
+# 4. PREBUILT SKELETONS
+# ==========================================
+# The "splice" mode never touches the template pages per request. Each
+# template is serialized once; a request appends a PDF incremental update that
+# replaces only the form pages that got fields, pointing their /Contents at the
+# original streams plus one new overlay stream. Untouched pages, fonts and
+# images are passed through as the same bytes every time.
+OVERLAY_FONT = NameObject("/ACCOverlay")
+
+class SkeletonPage:
+    """What a request needs to rewrite one page of a skeleton"""
+    def __init__(self, page):
+        self.idnum = page.indirect_reference.idnum
+        self.entries = dict(page.items())
+        contents = page.raw_get("/Contents") if "/Contents" in page else None
+        if contents is None:
+            self.contents = []
+        elif isinstance(contents.get_object(), ArrayObject):
+            self.contents = list(contents.get_object())
+        else:
+            self.contents = [contents]
+        resources = page.get("/Resources")
+        self.resources = dict(resources.items()) if resources else {}
+        fonts = resources.get("/Font") if resources else None
+        self.fonts = dict(fonts.items()) if fonts else {}
+
+class Skeleton:
+    """A template written out once, with what is needed to splice pages into it.
+
+    `base` is taken as-is when given (optimize_pdf output); otherwise the
+    reader's pages are written out through a PdfWriter.
+    """
+    def __init__(self, reader, base=None):
+        if base is None:
+            writer = PdfWriter()
+            for page in reader.pages:
+                writer.add_page(page)
+            out = io.BytesIO()
+            writer.write(out)
+            base = out.getvalue()
+        self.base = base
+
+        # Read back what was actually written, so object numbers always match
+        written = PdfReader(io.BytesIO(self.base))
+        self.xref_offset = int(self.base[self.base.rindex(b"startxref") + 9:].split()[0])
+        # An update to a file indexed by an xref stream gets one too
+        self.xref_stream = not self.base.startswith(b"xref", self.xref_offset)
+        self.size = int(written.trailer["/Size"])
+        self.trailer = {key: written.trailer.raw_get(key)
+                        for key in ("/Root", "/Info", "/ID") if key in written.trailer}
+        self.pages = [SkeletonPage(page) for page in written.pages]
+
+def _pdf_string(value):
+    raw = str(value).encode("cp1252", "replace")
+    for char, escaped in ((b"\\", b"\\\\"), (b"(", b"\\("), (b")", b"\\)"),
+                          (b"\r", b"\\r"), (b"\n", b"\\n")):
+        raw = raw.replace(char, escaped)
+    return raw
+
+def overlay_ops(fields, data, font_size):
+    """Content-stream operators for the filled-in fields of one overlay page.
+
+    Returns None when nothing on the page is filled in.
+    """
+    get = data.get
+    font = b"%s %d Tf %g TL" % (OVERLAY_FONT.encode(), font_size, font_size * 1.2)
+    ops = [b"Q\n"]
+    for is_check, x, y, key, when in fields:
+        value = get(key)
+        if not value or (when and get(when[0]) != when[1]):
+            continue
+        text = b"X" if is_check else _pdf_string(value)
+        # One text object per field, as reportlab's drawString writes them
+        ops.append(b"BT %s 1 0 0 1 %g %g Tm (%s) Tj T* ET\n" % (font, x, y, text))
+    if len(ops) == 1:
+        return None
+    return b"".join(ops)
+
+def splice_final_pdf(data, form_type, templates=None, optimize=False, span=NULL_SPAN):
+    """The final PDF as a list of byte parts: the shared skeleton, then this request's update"""
+    templates = templates or TEMPLATES
+
+    spec = FORMS[form_type]
+    skeleton = templates.get(spec.template, optimize).skeleton()
+    span.stage("template")
+
+    # Same fonts reportlab used: size 10 on the first overlay page, its
+    # default of 12 after showPage
+    page_ops = [(index, overlay_ops(fields, data, 10 if page_no == 0 else 12))
+                for page_no, (fields, index) in enumerate(zip(spec.compiled, spec.pages))]
+    page_ops = [(index, ops) for index, ops in page_ops if ops and index < len(skeleton.pages)]
+    span.stage("overlay")
+    parts = splice_pages(skeleton, page_ops)
+    span.stage("splice")
+    return parts
+
+def splice_pages(skeleton, page_ops):
+    """[skeleton.base, update] where the update appends ops to the pages in
+    page_ops: a list of (skeleton page index, content-stream bytes)"""
+    if not page_ops:
+        return [skeleton.base]
+
+    next_id = skeleton.size
+    font_ref = IndirectObject(next_id, 0, None)
+    open_ref = IndirectObject(next_id + 1, 0, None)
+    next_id += 2
+
+    out = io.BytesIO()
+    base_len = len(skeleton.base)
+    offsets = {}
+
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+        NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+    })
+    offsets[font_ref.idnum] = write_object(out, font_ref.idnum, font)
+    opener = DecodedStreamObject()
+    opener.set_data(b"q\n")
+    offsets[open_ref.idnum] = write_object(out, open_ref.idnum, opener)
+
+    for index, ops in page_ops:
+        page = skeleton.pages[index]
+        stream = DecodedStreamObject()
+        stream.set_data(ops)
+        stream_id = next_id
+        next_id += 1
+        offsets[stream_id] = write_object(out, stream_id, stream.flate_encode())
+
+        fonts = DictionaryObject(page.fonts)
+        fonts[OVERLAY_FONT] = font_ref
+        resources = DictionaryObject(page.resources)
+        resources[NameObject("/Font")] = fonts
+        new_page = DictionaryObject(page.entries)
+        new_page[NameObject("/Resources")] = resources
+        new_page[NameObject("/Contents")] = ArrayObject(
+            [open_ref] + page.contents + [IndirectObject(stream_id, 0, None)])
+        offsets[page.idnum] = write_object(out, page.idnum, new_page)
+
+    trailer = DictionaryObject({NameObject(key): value for key, value in skeleton.trailer.items()})
+    trailer[NameObject("/Prev")] = NumberObject(skeleton.xref_offset)
+    if skeleton.xref_stream:
+        entries = {idnum: (1, base_len + offset, 0) for idnum, offset in offsets.items()}
+        entries[next_id] = (1, base_len + out.tell(), 0)
+        xref_offset = base_len + write_object(out, next_id, xref_stream(entries, next_id + 1, trailer))
+        out.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+    else:
+        xref_offset = base_len + out.tell()
+        out.write(b"xref\n0 1\n0000000000 65535 f \n")
+        for idnum in sorted(offsets):
+            out.write(b"%d 1\n%010d 00000 n \n" % (idnum, base_len + offsets[idnum]))
+        trailer[NameObject("/Size")] = NumberObject(next_id)
+        out.write(b"trailer\n")
+        trailer.write_to_stream(out)
+        out.write(b"\nstartxref\n%d\n%%%%EOF\n" % xref_offset)
+    return [skeleton.base, out.getvalue()]
+
+# ==========================================
+# 5. ACROFORM FILL
+# ==========================================
+# The "acroform" modes skip overlays altogether. Each template gets real form
+# fields at the layout coordinates once (Template.with_fields); a request
+# clones that and lets pypdf fill the fields, optionally flattening them
+# into the page.
+FILL_MODES = {"acroform": False, "acroform-flat": True}
+
+HELVETICA = DictionaryObject({
+    NameObject("/Type"): NameObject("/Font"),
+    NameObject("/Subtype"): NameObject("/Type1"),
+    NameObject("/BaseFont"): NameObject("/Helvetica"),
+    NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+})
+
+# pypdf draws a field's text 2pt in from the left of its box with Helvetica's
+# ascent (718/1000) centred vertically; boxes are placed so that puts the
+# baseline where drawString put it
+FIELD_HEIGHT = 12
+FIELD_INSET = 2
+HELVETICA_ASCENT = 0.718
+# Text fields run to the next field on the same line, or to a half-inch margin
+FIELD_RIGHT_EDGE = 576
+
+def field_name(key, when):
+    """Unique AcroForm field name; conditional entries get the value they depend on"""
+    return key if not when else f"{key}_{when[1].replace(' ', '_')}"
+
+def _field_width(x, y, fields):
+    right = min((fx for _, fx, fy, _, _ in fields if fx > x and abs(fy - y) <= 2),
+                default=FIELD_RIGHT_EDGE + FIELD_INSET)
+    return max(right - x - FIELD_INSET, 20)
+
+def _checkbox_appearance(writer, font_size, resources):
+    on = DecodedStreamObject()
+    on.set_data(b"BT /Helv %d Tf %d %g Td (X) Tj ET" % (font_size, FIELD_INSET, FIELD_INSET + 1))
+    off = DecodedStreamObject()
+    for stream in (on, off):
+        stream[NameObject("/Type")] = NameObject("/XObject")
+        stream[NameObject("/Subtype")] = NameObject("/Form")
+        stream[NameObject("/BBox")] = ArrayObject(
+            [NumberObject(0), NumberObject(0), NumberObject(FIELD_HEIGHT), NumberObject(FIELD_HEIGHT)])
+        stream[NameObject("/Resources")] = resources
+    return DictionaryObject({NameObject("/N"): DictionaryObject({
+        NameObject("/Yes"): writer._add_object(on),
+        NameObject("/Off"): writer._add_object(off),
+    })})
+
+def add_form_fields(reader, compiled, pages):
+    """Template bytes with a text field or checkbox for every layout entry.
+
+    pages is the template page index of each overlay page. Font sizes follow
+    the overlay: 10 on the first form page, reportlab's default of 12 after it.
+    """
+    writer = PdfWriter(clone_from=reader)
+    font_ref = writer._add_object(HELVETICA.clone(writer))
+    resources = DictionaryObject({NameObject("/Font"): DictionaryObject({NameObject("/Helv"): font_ref})})
+    fields = ArrayObject()
+
+    for page_no, (page_fields, index) in enumerate(zip(compiled, pages)):
+        if index >= len(writer.pages):
+            continue
+        page = writer.pages[index]
+        font_size = 10 if page_no == 0 else 12
+        annots = page.get("/Annots")
+        annots = ArrayObject(annots) if annots else ArrayObject()
+        for is_check, x, y, key, when in page_fields:
+            if is_check:
+                x0, y0 = x - FIELD_INSET, y - FIELD_INSET - 1
+                width = FIELD_HEIGHT
+            else:
+                x0 = x - FIELD_INSET
+                y0 = y - (FIELD_HEIGHT - HELVETICA_ASCENT * font_size) / 2
+                width = _field_width(x, y, page_fields)
+            field = DictionaryObject({
+                NameObject("/Type"): NameObject("/Annot"),
+                NameObject("/Subtype"): NameObject("/Widget"),
+                NameObject("/FT"): NameObject("/Btn" if is_check else "/Tx"),
+                NameObject("/T"): TextStringObject(field_name(key, when)),
+                NameObject("/Rect"): ArrayObject(FloatObject(round(v, 3)) for v in
+                                                 (x0, y0, x0 + width, y0 + FIELD_HEIGHT)),
+                NameObject("/F"): NumberObject(4), # print
+                NameObject("/BS"): DictionaryObject({NameObject("/W"): NumberObject(0)}),
+                NameObject("/DA"): TextStringObject(f"/Helv {font_size} Tf 0 g"),
+                NameObject("/P"): page.indirect_reference,
+            })
+            if is_check:
+                field[NameObject("/V")] = field[NameObject("/AS")] = NameObject("/Off")
+                field[NameObject("/AP")] = _checkbox_appearance(writer, font_size, resources)
+            ref = writer._add_object(field)
+            annots.append(ref)
+            fields.append(ref)
+        page[NameObject("/Annots")] = annots
+
+    writer.root_object[NameObject("/AcroForm")] = DictionaryObject({
+        NameObject("/Fields"): fields,
+        NameObject("/DR"): resources,
+        NameObject("/DA"): TextStringObject("/Helv 10 Tf 0 g"),
+    })
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+def form_values(compiled, data):
+    """{field name: value} for the entries that would be drawn, as update_page_form_field_values takes them"""
+    get = data.get
+    values = {}
+    for fields in compiled:
+        for is_check, _, _, key, when in fields:
+            value = get(key)
+            if not value or (when and get(when[0]) != when[1]):
+                continue
+            values[field_name(key, when)] = "/Yes" if is_check else str(value)
+    return values
+
+def fill_final_pdf(data, form_type, templates=None, optimize=False, flatten=False, span=NULL_SPAN):
+    """Fills the template's AcroForm fields; returns the PdfWriter.
+
+    flatten=True draws the values into the pages and drops the fields, so the
+    result can't be edited; otherwise the PDF stays a fillable form.
+    """
+    templates = templates or TEMPLATES
+    spec = FORMS[form_type]
+    template = templates.get(spec.template, optimize).with_fields(spec)
+    span.stage("template")
+    values = form_values(spec.compiled, data)
+
+    with template.lock:
+        output = PdfWriter(clone_from=template.reader)
+    span.stage("clone")
+
+    if values:
+        output.update_page_form_field_values(None, values, auto_regenerate=False, flatten=flatten)
+    if flatten:
+        output.remove_annotations(subtypes="/Widget")
+        del output.root_object["/AcroForm"]
+    span.stage("fill")
+    return output
+
+# ==========================================
+# 6. RESULT CACHE
+# ==========================================
+def normalize_form_data(data, form_type):
+    """form_data reduced to what can change the PDF: the keys the layout reads,
+    empty values dropped, everything else as the string that gets drawn"""
+    normalized = {}
+    for key in FORMS[form_type].keys:
+        value = data.get(key)
+        if value:
+            normalized[key] = str(value)
+    return normalized
+
+def result_key(data, form_type, template_hash, mode="splice"):
+    """Stable hash of everything that can change the generated PDF"""
+    normalized = normalize_form_data(data, form_type)
+    # The form's digest covers its layout and page map, which a revised
+    # definition can change without touching the template
+    payload = json.dumps([form_type, mode, template_hash, FORMS[form_type].digest, normalized], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """Thread-safe LRU of final PDF bytes, bounded by total size in bytes"""
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            pdf = self._entries.get(key)
+            if pdf is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf
+
+    def put(self, key, pdf):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._entries[key] = pdf
+            self.bytes += len(pdf)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+def generate_pdf_bytes(data, form_type, templates=None, cache=None, mode="splice", optimize=False,
+                       archive=None, attachments=None, max_attachment_bytes=MAX_ATTACHMENT_BYTES):
+    """Final PDF as bytes, served from `cache` when the same inputs were seen before.
+
+    mode="splice" appends the form pages to a prebuilt skeleton (the default);
+    mode="merge" runs the original merge_page pipeline through PdfWriter;
+    mode="acroform" / "acroform-flat" fill real form fields instead (section 5).
+    optimize=True builds either one on the optimized template (see optimize.py).
+    `attachments` (paths or file objects) are added after the application by
+    attachments.append_attachments; only the application itself is cached.
+    Every result, cached or not, is recorded in `archive` (archive.Archive)
+    when one is given, attachments included.
+    """
+    templates = templates or TEMPLATES
+    with METRICS.span(form_type, mode + "-optimized" if optimize else mode) as span:
+        if cache is not None or archive is not None:
+            # The optimized template has its own hash, so it keys separately
+            template = templates.get(FORMS[form_type].template, optimize)
+        if cache is not None:
+            key = result_key(data, form_type, template.sha256, mode)
+            pdf = cache.get(key)
+            span.stage("cache")
+            if pdf is not None:
+                parts = _with_attachments([pdf], attachments, max_attachment_bytes, span)
+                pdf = b"".join(parts)
+                if archive is not None:
+                    archive.put(form_type, normalize_form_data(data, form_type), pdf, template.sha256, mode, parts)
+                    span.stage("archive")
+                span.result(len(pdf), cache_hit=True)
+                return pdf
+
+        parts = None
+        if mode == "merge":
+            out = io.BytesIO()
+            generate_final_pdf(data, form_type, templates, optimize, span).write(out)
+            pdf = out.getvalue()
+        elif mode in FILL_MODES:
+            out = io.BytesIO()
+            fill_final_pdf(data, form_type, templates, optimize, FILL_MODES[mode], span).write(out)
+            pdf = out.getvalue()
+        else:
+            parts = splice_final_pdf(data, form_type, templates, optimize, span)
+            pdf = b"".join(parts)
+        span.stage("write")
+        if cache is not None:
+            cache.put(key, pdf)
+        parts = _with_attachments(parts or [pdf], attachments, max_attachment_bytes, span)
+        pdf = b"".join(parts)
+        if archive is not None:
+            # The skeleton part is the same for every request on this template,
+            # so the archive keeps it once
+            archive.put(form_type, normalize_form_data(data, form_type), pdf, template.sha256, mode, parts)
+            span.stage("archive")
+        span.result(len(pdf))
+        return pdf
+
+def _with_attachments(parts, attachments, max_bytes, span):
+    """parts plus the incremental update adding `attachments`, as one more part"""
+    if not attachments:
+        return parts
+    chunks = []
+    append_attachments(b"".join(parts), attachments, chunks.append, max_bytes=max_bytes)
+    span.stage("attachments")
+    # The first chunk is the PDF passed in; the rest is the update
+    return parts + [b"".join(chunks[1:])]
+
+# ==========================================
+# 7. HOUSEHOLD BUNDLES
+# ==========================================
+# Several applications for one owner and lot in a single PDF. The selected
+# templates are put together once per combination: identical objects are
+# stored once and the copies of each font the templates embed are folded into
+# one file. A request then splices every form's overlay into that document the
+# same way splice_final_pdf does for one form.
+def household(forms):
+    """The form types of `forms`, a list of (form_type, form_data), after
+    checking they are one application per form for one owner and lot"""
+    form_types = tuple(form_type for form_type, _ in forms)
+    if not form_types:
+        raise ValueError("A bundle needs at least one application")
+    unknown = [form_type for form_type in form_types if form_type not in FORMS]
+    if unknown:
+        raise ValueError(f"Unknown form_type {unknown[0]!r}")
+    if len(set(form_types)) != len(form_types):
+        raise ValueError("A bundle can hold only one application per form type")
+    for key in ("owner_name", "lot_number"):
+        values = {str(data.get(key)).strip() for _, data in forms if data.get(key)}
+        if len(values) > 1:
+            raise ValueError(f"Applications in a bundle must share one {key}, got {sorted(values)}")
+    return form_types
+
+def build_bundle(form_types, templates=None, optimize=False, form_pages_only=False):
+    """The templates of form_types as one PDF; returns (bytes, form pages).
+
+    form pages maps each form type to the bundle page index of each of its
+    overlay pages (None past the end of the template). form_pages_only drops
+    each form's instruction pages. Each form starts with an outline entry.
+    """
+    templates = templates or TEMPLATES
+    writer = PdfWriter()
+    form_pages = {}
+
+    for form_type in form_types:
+        spec = FORMS[form_type]
+        template = templates.get(spec.template, optimize)
+        skip = spec.instruction_pages if form_pages_only else ()
+        first = len(writer.pages)
+        placed = {}
+        with template.lock:
+            for index, page in enumerate(template.reader.pages):
+                if index not in skip:
+                    placed[index] = len(writer.pages)
+                    writer.add_page(page)
+        form_pages[form_type] = [placed.get(index) for index in spec.pages]
+        writer.add_outline_item(form_type, first)
+
+    share_fonts(writer)
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    out = io.BytesIO()
+    writer.write(out)
+    if optimize:
+        return write_compact(PdfReader(out)), form_pages
+    return out.getvalue(), form_pages
+
+def splice_bundle_pdf(forms, templates=None, optimize=False, form_pages_only=False, span=NULL_SPAN):
+    """One PDF for a list of (form_type, form_data), as byte parts like splice_final_pdf"""
+    templates = templates or TEMPLATES
+    bundle = templates.bundle(household(forms), optimize, form_pages_only)
+    skeleton = bundle.skeleton()
+    span.stage("template")
+
+    page_ops = []
+    for form_type, data in forms:
+        compiled = FORMS[form_type].compiled
+        for page_no, (fields, index) in enumerate(zip(compiled, bundle.form_pages[form_type])):
+            ops = overlay_ops(fields, data, 10 if page_no == 0 else 12)
+            if ops and index is not None:
+                page_ops.append((index, ops))
+    span.stage("overlay")
+    parts = splice_pages(skeleton, page_ops)
+    span.stage("splice")
+    return parts
+
+def generate_bundle_bytes(forms, templates=None, optimize=False, form_pages_only=False, archive=None):
+    """The household bundle for `forms` as bytes.
+
+    With an `archive` it is recorded under the joined form types
+    ("Roofing+Solar"), with each application's normalized form_data.
+    """
+    templates = templates or TEMPLATES
+    mode = "bundle-forms" if form_pages_only else "bundle"
+    form_label = "+".join(form_type for form_type, _ in forms)
+    with METRICS.span(form_label, mode + "-optimized" if optimize else mode) as span:
+        parts = splice_bundle_pdf(forms, templates, optimize, form_pages_only, span)
+        pdf = b"".join(parts)
+        span.stage("write")
+        if archive is not None:
+            bundle = templates.bundle(household(forms), optimize, form_pages_only)
+            record = {"forms": {form_type: normalize_form_data(data, form_type) for form_type, data in forms}}
+            # household() has checked the applications agree on these
+            for key in ("owner_name", "lot_number"):
+                value = next((data[key] for data in record["forms"].values() if key in data), None)
+                if value:
+                    record[key] = value
+            archive.put(form_label, record, pdf, bundle.sha256, mode, parts)
+            span.stage("archive")
+        span.result(len(pdf))
+        return pdf
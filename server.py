@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless HTTP service for the Lakes HOA ACC applications
+
+Standard library only. Runs the same overlay + generate_final_pdf pipeline as
+the Streamlit app without a Streamlit session per user. With the result cache
+disabled (--cache-mb 0) and no --archive, the PDF is serialized straight into
+the response.
+
+    POST /generate/<Painting|Remodel|Roofing|Solar>   body: form_data JSON
+    GET  /health                                      queue and cache stats
+    GET  /metrics                                     per-stage timings (with --metrics)
+
+    python server.py --port 8502 --workers 4
+
+With --archive every PDF is recorded, but archived applications are only
+read back with the archive.py CLI: they hold residents' contact details, and
+this port is open to every caller.
+"""
+import sys
+import json
+import queue
+import argparse
+import threading
+import tracemalloc
+from datetime import date
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import pdf_engine
+from archive import Archive
+from metrics import METRICS
+
+MAX_BODY_BYTES = 256 * 1024
+
+# ==========================================
+# 1. GENERATION POOL
+# ==========================================
+class Overloaded(Exception):
+    pass
+
+class GenerationAbandoned(Exception):
+    """Raised inside a worker when nobody is reading its output any more"""
+
+_DONE = object()
+
+class GenerationPool:
+    """Bounded worker pool: at most `workers` running and `queue_size` waiting.
+
+    Submitting past that raises Overloaded straight away instead of letting
+    requests pile up behind a slow merge.
+    """
+    def __init__(self, workers=4, queue_size=32, templates=None, cache=None, trace_memory=False,
+                 optimize=False, archive=None):
+        self.templates = templates or pdf_engine.TEMPLATES
+        self.cache = cache
+        self.archive = archive
+        self.trace_memory = trace_memory
+        self.optimize = optimize
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self.workers = workers
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.last_peak_bytes = None
+        self.max_peak_bytes = 0
+
+    def _run(self, fn, *args):
+        """fn's result and its peak traced memory (None unless trace_memory)"""
+        try:
+            if not self.trace_memory:
+                return fn(*args), None
+            with pdf_engine.peak_memory() as mem:
+                result = fn(*args)
+            with self._lock:
+                self.last_peak_bytes = mem["peak_bytes"]
+                self.max_peak_bytes = max(self.max_peak_bytes, mem["peak_bytes"])
+            return result, mem["peak_bytes"]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Overloaded()
+        with self._lock:
+            self.in_flight += 1
+        return self._executor.submit(self._run, fn, *args)
+
+    def _timed_out(self, future):
+        # A job that never started gives its slot back here; one that is
+        # already running keeps it until it finishes, so a stuck merge
+        # still counts against the queue
+        with self._lock:
+            self.timed_out += 1
+            if future.cancel():
+                self.in_flight -= 1
+                self._slots.release()
+
+    def generate(self, form_data, form_type, timeout=30):
+        """(PDF bytes, this generation's peak traced memory or None).
+
+        The PDF comes from the result cache if there is one and it has it.
+        """
+        future = self._submit(pdf_engine.generate_pdf_bytes, form_data, form_type,
+                              self.templates, self.cache, "splice", self.optimize, self.archive)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            self._timed_out(future)
+            raise
+
+    def stream(self, form_data, form_type, timeout=30, max_chunks=4, info=None):
+        """Yields the PDF in chunks while a worker is still serializing it.
+
+        At most `max_chunks` chunks wait in memory; if the consumer stops
+        reading, the worker gives up instead of buffering the rest. Once the
+        last chunk is out, info["peak_bytes"] holds the generation's peak
+        traced memory (None unless trace_memory).
+        """
+        chunks = queue.Queue(max_chunks)
+        abandoned = threading.Event()
+
+        def put(item):
+            while not abandoned.is_set():
+                try:
+                    chunks.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    pass
+            raise GenerationAbandoned()
+
+        def work():
+            try:
+                pdf_engine.stream_final_pdf(form_data, form_type, put, self.templates,
+                                            optimize=self.optimize)
+                put(_DONE)
+            except GenerationAbandoned:
+                pass
+            except Exception as e:
+                put(e)
+
+        future = self._submit(work)
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=timeout)
+                except queue.Empty:
+                    self._timed_out(future)
+                    raise FutureTimeout()
+                if item is _DONE:
+                    if info is not None:
+                        # The worker leaves its peak_memory block right after _DONE
+                        info["peak_bytes"] = future.result(timeout=timeout)[1]
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            abandoned.set()
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "queue_size": self.queue_size,
+                    "in_flight": self.in_flight, "rejected": self.rejected,
+                    "timed_out": self.timed_out, "last_peak_bytes": self.last_peak_bytes,
+                    "max_peak_bytes": self.max_peak_bytes if self.trace_memory else None}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# ==========================================
+# 2. HTTP HANDLER
+# ==========================================
+class Handler(BaseHTTPRequestHandler):
+    server_version = "LakesACC/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip("/")
+        if path == "/metrics" and METRICS.enabled:
+            body = METRICS.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path != "/health":
+            return self._send_json(404, {"error": "not found"})
+        stats = {"pool": self.server.pool.stats(), "forms": sorted(pdf_engine.FORMS)}
+        if self.server.pool.cache is not None:
+            stats["cache"] = self.server.pool.cache.stats()
+        if self.server.pool.archive is not None:
+            stats["archive"] = self.server.pool.archive.stats()
+        if METRICS.enabled:
+            stats["stages"] = METRICS.aggregates()
+        self._send_json(200, stats)
+
+    def do_POST(self):
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "generate":
+            return self._send_json(404, {"error": "not found"})
+        form_type = parts[1]
+        if form_type not in pdf_engine.FORMS:
+            return self._send_json(404, {"error": f"unknown form type {form_type!r}",
+                                         "forms": sorted(pdf_engine.FORMS)})
+
+        # A body that is refused here is never read, so the connection can't
+        # be reused after any of these
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self.close_connection = True
+            return self._send_json(411, {"error": "Content-Length required"})
+        if not length.strip().isdigit():
+            self.close_connection = True
+            return self._send_json(400, {"error": f"invalid Content-Length {length!r}"})
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            return self._send_json(413, {"error": "request body too large"})
+        try:
+            form_data = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(form_data, dict):
+                raise ValueError("body must be a JSON object")
+        except ValueError as e:
+            return self._send_json(400, {"error": f"invalid JSON: {e}"})
+        form_data.setdefault("date_prepared", date.today().strftime("%B %d, %Y"))
+
+        pool = self.server.pool
+        keep = pool.cache is not None or pool.archive is not None
+        try:
+            if not keep:
+                # Nothing to keep, so serialize straight into the response
+                info = {}
+                chunks = pool.stream(form_data, form_type, timeout=self.server.request_timeout, info=info)
+                first = next(chunks, b"")
+            else:
+                pdf, peak_bytes = pool.generate(form_data, form_type, timeout=self.server.request_timeout)
+        except Overloaded:
+            self.send_response(503)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        except FutureTimeout:
+            return self._send_json(504, {"error": "generation timed out"})
+        except FileNotFoundError as e:
+            return self._send_json(500, {"error": f"template missing: {e}"})
+        except Exception as e:
+            return self._send_json(500, {"error": str(e)})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Disposition", f'attachment; filename="{form_type}_App.pdf"')
+        if keep:
+            self.send_header("Content-Length", str(len(pdf)))
+            if peak_bytes is not None:
+                self.send_header("X-Peak-Memory-Bytes", str(peak_bytes))
+            self.end_headers()
+            for chunk in pdf_engine.iter_chunks(pdf):
+                self.wfile.write(chunk)
+            return
+
+        self.send_header("Transfer-Encoding", "chunked")
+        if pool.trace_memory:
+            # Only known once the body is out, so it follows as a trailer
+            self.send_header("Trailer", "X-Peak-Memory-Bytes")
+        self.end_headers()
+        try:
+            self._write_chunk(first)
+            for chunk in chunks:
+                self._write_chunk(chunk)
+            self.wfile.write(b"0\r\n")
+            if info.get("peak_bytes") is not None:
+                self.wfile.write(b"X-Peak-Memory-Bytes: %d\r\n" % info["peak_bytes"])
+            self.wfile.write(b"\r\n")
+        except Exception:
+            # Headers are gone already; dropping the connection is the only
+            # way left to tell the client the body is incomplete
+            self.close_connection = True
+
+    def _write_chunk(self, chunk):
+        if chunk:
+            self.wfile.write(b"%X\r\n" % len(chunk))
+            self.wfile.write(chunk)
+            self.wfile.write(b"\r\n")
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class PdfServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Let bursts queue in the kernel and be refused by the pool with a 503,
+    # rather than reset at connect time
+    request_queue_size = 128
+
+    def __init__(self, address, pool, request_timeout=30, verbose=False):
+        super().__init__(address, Handler)
+        self.pool = pool
+        self.request_timeout = request_timeout
+        self.verbose = verbose
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ACC application PDFs over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=32, help="requests allowed to wait for a worker")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request gets 504")
+    parser.add_argument("--cache-mb", type=int, default=64, help="result cache size, 0 to disable")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="track peak memory per generation with tracemalloc; generations then run one at a time")
+    parser.add_argument("--optimize", action="store_true", help="serve size-optimized PDFs (see optimize.py)")
+    parser.add_argument("--image-dpi", type=int, default=None,
+                        help="with --optimize, downsample images drawn above this DPI")
+    parser.add_argument("--metrics", action="store_true", help="record per-stage timings, served on /metrics")
+    parser.add_argument("--metrics-log", help="also append one JSON line per request to this file")
+    parser.add_argument("--archive", help="record every PDF in this archive database (read it with archive.py)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    cache = pdf_engine.ResultCache(args.cache_mb * 1024 * 1024) if args.cache_mb else None
+    if args.trace_memory:
+        tracemalloc.start()
+    if args.metrics or args.metrics_log:
+        METRICS.enable(trace_memory=args.trace_memory, log_path=args.metrics_log)
+    templates = pdf_engine.TemplateCache(image_dpi=args.image_dpi)
+    archive = Archive(args.archive) if args.archive else None
+    pool = GenerationPool(args.workers, args.queue_size, templates, cache, args.trace_memory, args.optimize,
+                          archive)
+    # Listen straight away; requests that beat the pre-warm just wait on the
+    # template locks it holds
+    pdf_engine.prewarm_in_background(pool.templates, args.optimize)
+
+    server = PdfServer((args.host, args.port), pool, args.timeout, args.verbose)
+    print(f"Serving ACC PDFs on http://{args.host}:{args.port}/generate/<form_type>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())